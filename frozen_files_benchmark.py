@@ -0,0 +1,245 @@
+################################################################################
+################################ INTRODUCTION ##################################
+################################################################################
+
+# This script measures how fast frozen_files_database_github_version.py loads
+# frozen files, and how that changes as the data grows. For each number of
+# students asked for, it generates a synthetic set of demographics,
+# courses_taken and transfer files with the same column headers as real
+# extracts, loads them into a fresh database, and reports for each type of file
+# the rows read per second, the peak memory use of the loader and the size of the
+# database afterwards. Running it before each semester's load shows the scaling
+# curve on that machine, and running it before and after a change to the loader
+# catches regressions.
+#
+# Example, for 1,000, 10,000 and 100,000 students over 6 terms and 3 extracts:
+#     python frozen_files_benchmark.py 1000 10000 100000 --terms 6 --extracts 3
+
+
+################################################################################
+################################ ADMINISTRATIVE ################################
+################################################################################
+
+# required libraries
+import argparse
+import csv
+import importlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+try:
+    import resource
+except ImportError: # not available on Windows, where peak memory isn't reported
+    resource = None
+
+### the loader being measured, imported from beside this script
+loader_dir = os.path.dirname(os.path.abspath(__file__))
+loader_name = "frozen_files_database_github_version"
+
+
+################################################################################
+############################# GENERATE FROZEN FILES ############################
+################################################################################
+
+### values drawn from when generating files
+student_types = ['FTIC', 'CONT', 'TRAN', 'DUAL', 'GUEST']
+genders = ['F', 'M', 'U']
+races = ['White', 'Black', 'Asian', 'American Indian', 'Pacific Islander', 'Two or More', 'Unknown']
+ethnicities = ['Hispanic', 'Not Hispanic', 'Unknown']
+subjects = ['ACC', 'ART', 'BIO', 'BUS', 'CHM', 'CIS', 'COM', 'ECO', 'ENG', 'HIS', 'MTH', 'NUR', 'PHY', 'PSY', 'SOC']
+grades = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D', 'F', 'W', 'I']
+statuses = ['Active', 'Active', 'Active', 'Active', 'Dropped']
+credit_types = ['Degree', 'Degree', 'Degree', 'Developmental', 'Audit']
+course_types = ['Lecture', 'Online', 'Hybrid', 'Lab']
+colleges = ['Jackson College', 'Western Michigan University', 'Michigan State University', 'University of Michigan', 'Eastern Michigan University', 'Lansing Community College']
+
+### function for the name and start date of the n-th term, three terms a year from fall 2015
+def term(n):
+    year = 2015 + (n + 2) // 3
+    season = ['FA', 'WI', 'SP'][n % 3]
+    start = date(year, [8, 1, 5][n % 3], [26, 6, 4][n % 3])
+    return season + str(year)[2:], start
+
+### function for writing dates as the frozen files do
+def mdy(d, timestamp=True):
+    return '%d/%d/%d%s' % (d.month, d.day, d.year, ' 0:00' if timestamp else '')
+
+### function for writing a synthetic set of frozen files into a directory
+# each of the extracts is a snapshot of every term so far, with students starting
+# in a random term and staying a few terms; duplicate_rate is the share of rows
+# written twice, as happens in real extracts; returns the number of rows written
+# to the files of each type
+def generate_frozen_files(path, f, students, terms, extracts, duplicate_rate, seed=0):
+    rng = random.Random(seed)
+    course_names = ['%s-%d' % (s, n) for s in subjects for n in range(100, 300, 10)]
+    catalog = {name: (name.split('-')[0], rng.choice(['1', '2', '3', '3', '4', '4', '5'])) for name in course_names}
+    people = []
+    for p in range(students):
+        first = rng.randrange(terms)
+        birth = date(1960, 1, 1) + timedelta(days=rng.randrange(365 * 45))
+        people.append({
+            'pid': 'S%08d' % p,
+            'uic': '%010d' % rng.randrange(10**10),
+            'bd': mdy(birth),
+            'hs': mdy(date(birth.year + 18, 6, rng.randrange(1, 29))),
+            'z': '49%03d' % rng.randrange(300),
+            'g': rng.choice(genders),
+            'r1': rng.choice(races),
+            'e1': rng.choice(ethnicities),
+            'terms': range(first, min(terms, first + rng.randint(1, 6)))
+        })
+    rows = {'demographics': 0, 'courses_taken': 0, 'transfer': 0}
+
+    def write(writer, kind, row):
+        writer.writerow(row)
+        rows[kind] += 1
+        if rng.random() < duplicate_rate:
+            writer.writerow(row)
+            rows[kind] += 1
+
+    ### demographics and courses_taken files, one of each per extract
+    for x in range(extracts):
+        ffe = 'Extract_%02d' % (x + 1)
+        with open(os.path.join(path, 'demographics_%s.csv' % ffe), 'w', newline='') as dhand, \
+             open(os.path.join(path, 'courses_taken_%s.csv' % ffe), 'w', newline='') as chand:
+            demographics = csv.writer(dhand)
+            demographics.writerow([f[a] for a in ('pid', 'et', 'ffe', 'uic', 'sct', 'g', 'r1', 'e1', 'z', 'bd', 'hs')])
+            courses_taken = csv.writer(chand)
+            courses_taken.writerow([f[a] for a in ('pid', 'et', 'ffe', 'evgJ10', 'ecs', 'ecct', 'ecctJ10', 'ecfnJ10', 'ecn', 'ecsub', 'scvJ10', 'bcJ10', 'etsd')])
+            for person in people:
+                for n in person['terms']:
+                    et, start = term(n)
+                    sct = 'FTIC' if n == person['terms'][0] else rng.choice(student_types[1:])
+                    write(demographics, 'demographics', [person['pid'], et, ffe, person['uic'], sct, person['g'], person['r1'], person['e1'], person['z'], person['bd'], person['hs']])
+                    for name in rng.sample(course_names, rng.randint(1, 5)):
+                        subject, credits = catalog[name]
+                        write(courses_taken, 'courses_taken', [person['pid'], et, ffe, rng.choice(grades), rng.choice(statuses), rng.choice(credit_types),
+                            rng.choice(course_types), '%s %s' % (name, et), name, subject, credits, credits, mdy(start, rng.random() < 0.5)])
+
+    ### one NSC transfer file, with records for about a third of students
+    with open(os.path.join(path, 'transfer_nsc.csv'), 'w', newline='') as thand:
+        transfers = csv.writer(thand)
+        transfers.writerow([f[a] for a in ('pid', 'rf', 'grad?', 'cn', 'eb', 'ee')])
+        for person in people:
+            if rng.random() < 1 / 3:
+                for k in range(rng.randint(1, 3)):
+                    begin = term(person['terms'][-1] + k)[1]
+                    write(transfers, 'transfer', [person['pid'], rng.choice('YYYYN'), rng.choice('NNNNY'), rng.choice(colleges),
+                        begin.strftime('%Y%m%d'), (begin + timedelta(days=110)).strftime('%Y%m%d')])
+    return rows
+
+
+################################################################################
+################################### BENCHMARK ##################################
+################################################################################
+
+### function for the peak memory use so far, in MB, of this process or of any of its finished
+### child processes, whichever is larger; the children are the processes parsing files with
+### --workers and loading shards with --sharded, which the pools have joined by the end of each stage
+def peak_rss():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB elsewhere
+
+### function for the size of the loader's database so far, in MB, once the pages in its
+### write-ahead log are checkpointed into it, so that it compares with a database without one
+def db_size(loader):
+    loader.c.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(loader.db_path) / 2**20
+
+### function for generating the files of one load, run in a process of its own before the load
+### is measured in another, so that the generator's memory isn't counted in the load's peak
+### memory use; sends the number of rows written to the files of each type through results
+def generate(workdir, students, options, results):
+    sys.path.insert(0, loader_dir)
+    module = importlib.import_module(loader_name)
+    results.send(generate_frozen_files(workdir, module.f, students, options['terms'], options['extracts'], options['duplicate_rate'], options['seed']))
+
+### function for measuring one load of the files generated, with the rows of each type, run in a
+### process of its own so that peak memory use is that of this load alone; sends a list of result
+### rows through results
+def measure(workdir, students, rows, options, results):
+    sys.path.insert(0, loader_dir)
+    module = importlib.import_module(loader_name)
+    loader = module.FrozenFileLoader(os.path.join(workdir, module.db_path), workdir,
+        chunk_size=options['chunk_size'] or None, workers=options['workers'], load_engine=options['load_engine'], storage=options['storage'])
+    loader.create_schema()
+    stages = [('demographics', loader.load_demographics), ('courses_taken', loader.load_courses_taken), ('transfer', loader.load_transfers)]
+    if options['sharded']:
+        # the files of every type are loaded together, into shards merged afterwards
+        stages = [('sharded', loader.load_sharded)]
+        rows['sharded'] = sum(rows.values())
+    report = []
+    with loader.bulk_load() if options['bulk'] else nullcontext():
+        for kind, load in stages:
+            start = time.perf_counter()
+            load()
+            seconds = time.perf_counter() - start
+            report.append((students, kind, rows[kind], seconds, rows[kind] / seconds if seconds else 0, peak_rss(), db_size(loader)))
+        start = time.perf_counter()
+    if options['bulk']:
+        # creating the deferred indexes and analyzing, at the end of the bulk load
+        seconds = time.perf_counter() - start
+        report.append((students, 'bulk indexes', 0, seconds, 0, peak_rss(), db_size(loader)))
+    start = time.perf_counter()
+    persons = loader.refresh_cohort_tables()
+    seconds = time.perf_counter() - start
+    report.append((students, 'cohort refresh', persons, seconds, persons / seconds if seconds else 0, peak_rss(), db_size(loader)))
+    loader.close()
+    results.send(report)
+
+### function for running target with args in a process of its own; returns what it sends
+### through the pipe given as its last argument
+def run_apart(target, *args):
+    receive, send = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=target, args=args + (send,))
+    process.start()
+    send.close() # so that recv fails rather than waits if the process dies
+    try:
+        return receive.recv()
+    finally:
+        process.join()
+
+### function for printing result rows as a table
+def print_report(report):
+    print('%10s  %-15s %12s %10s %12s %12s %10s' % ('students', 'stage', 'rows', 'seconds', 'rows/sec', 'peak RSS MB', 'DB MB'))
+    for students, stage, rows, seconds, rate, rss, size in report:
+        print('%10d  %-15s %12d %10.2f %12.0f %12s %10.1f' % (students, stage, rows, seconds, rate, '-' if rss is None else '%.1f' % rss, size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loading synthetic frozen files.")
+    parser.add_argument('students', nargs='*', type=int, default=[1000, 10000], help="numbers of students to measure loads for")
+    parser.add_argument('--terms', type=int, default=6, help="terms covered by the files")
+    parser.add_argument('--extracts', type=int, default=2, help="frozen file extracts, each a snapshot of every term")
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help="share of rows written twice")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the generated files")
+    parser.add_argument('--engine', dest='load_engine', choices=['rows', 'staging'], default='rows', help="load engine to measure")
+    parser.add_argument('--storage', choices=['snapshots', 'deltas'], default='snapshots', help="storage of demographic entries and enrollment events to measure")
+    parser.add_argument('--workers', type=int, default=None, help="processes parsing files in parallel")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="rows written per transaction; 0 loads each file as one transaction")
+    parser.add_argument('--bulk', action='store_true', help="load in bulk-load mode")
+    parser.add_argument('--sharded', action='store_true', help="load the files of each extract into shard databases merged afterwards")
+    parser.add_argument('--keep', metavar='DIR', help="keep the generated files and databases under DIR")
+    options = vars(parser.parse_args())
+
+    base = options['keep'] or tempfile.mkdtemp(prefix='frozen_files_benchmark_')
+    report = []
+    try:
+        for students in options['students']:
+            workdir = os.path.join(base, 'students_%d' % students)
+            os.makedirs(workdir)
+            rows = run_apart(generate, workdir, students, options)
+            report.extend(run_apart(measure, workdir, students, rows, options))
+    finally:
+        if not options['keep']:
+            shutil.rmtree(base)
+    print_report(report)
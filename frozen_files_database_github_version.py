@@ -14,6 +14,10 @@
 # in time. A concise database program like this can read in such extracts and begin
 # knittting together a coherent picture of these education data over time.
 
+# The script can be run to load the frozen files in a directory (see COMMAND LINE
+# below), or imported: its FrozenFileLoader loads into, refreshes, queries and
+# exports one database, and importing it has no effects of its own.
+
 
 ################################################################################
 ################################ ADMINISTRATIVE ################################
@@ -22,19 +26,79 @@
 # required libraries
 import sqlite3
 import os
+import sys
+import argparse
 import csv
+import hashlib
+import io
+import json
 import re
-from datetime import date
+import time
+import queue
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from datetime import date, datetime
+from functools import partial
+from itertools import groupby
+from pathlib import Path
+
+### default settings of a FrozenFileLoader, each of which can be given when one is
+### created (see LOADER below) or on the command line (see COMMAND LINE below);
+### importing this script only defines the schema, SQL and functions, and loads nothing
 
-### specify a path to directory containing data to be loaded
+### path to directory containing data to be loaded
 data_path = "some_file_path"
 
-### create database connection
+### path to the database file, created if it doesn't exist
 db_path = "frozen_file_database.db"
-conn = sqlite3.connect(db_path)
 
-### create a cursor object
-c = conn.cursor()
+### journal mode of the database, set when the schema is created; with a write-ahead log,
+### the connections of a QueryPool can read while a load writes (see RUN QUERIES below)
+journal_mode = "WAL"
+
+### number of csv rows written per transaction; None loads each file as one transaction
+chunk_size = 10000
+
+### number of processes parsing csv files in parallel; None parses them in this process
+workers = None
+
+### approximate size in bytes of the parts that csv files are split into for parsing
+part_size = 32 * 2**20
+
+### engine adding parsed records to the database: "rows" resolves foreign keys record by record
+### through the id cache, "staging" copies each chunk into a TEMP table and resolves them in SQL
+load_engines = ('rows', 'staging')
+load_engine = "rows"
+
+### how demographic entries and enrollment events are stored: "snapshots" stores the records of
+### every extract, "deltas" stores each record once with the range of consecutive extracts it is
+### in, so that a new extract only adds the records that changed (see ADD DATA below); a database
+### holds one storage, so this is only the storage of new databases, and a database already holding
+### records is loaded and queried in its own
+storages = ('snapshots', 'deltas')
+storage = "snapshots"
+
+### whether to instrument loads by counting the SQL statements run, by kind and table;
+### with it, a summary of where the time and rows went is printed at the end of the run,
+### or written as JSON to stats_path if one is given
+instrument = False
+stats_path = None
+
+### directory to write the columnar export of the fact tables to after each load; None skips it
+export_path = None
+
+### whether to run loads in bulk-load mode (see bulk_load), as for the initial load of historical
+### frozen files, and whether to VACUUM the database at its end
+bulk = False
+vacuum = False
+
+### whether to load the files of each extract in parallel into shard databases merged afterwards (see
+### load_sharded), and the directory of the shards; None puts them beside the database
+sharded = False
+shard_path = None
 
 ### function for extracting all Person IDs in a list of single tuples
 def plain_list(tups_list):
@@ -45,53 +109,190 @@ def plain_list(tups_list):
 ############################### CREATE TABLES ##################################
 ################################################################################
 
-### create the necessary tables, making sure that each is empty if already extant
-
-### single-field tables
-# Enrolled_Course_Credit_Type
-c.execute("CREATE TABLE IF NOT EXISTS Enrolled_Course_Credit_Type (Enrolled_Course_Credit_Type_id INTEGER PRIMARY KEY, Enrolled_Course_Credit_Type VARCHAR(128))")
-# Person_ID
-c.execute("CREATE TABLE IF NOT EXISTS Person_ID (Person_ID_id INTEGER PRIMARY KEY, Person_ID VARCHAR(128))")
-# Enrolled_Verified_Grade_J10
-c.execute("CREATE TABLE IF NOT EXISTS Enrolled_Verified_Grade_J10 (Enrolled_Verified_Grade_J10_id INTEGER PRIMARY KEY, Enrolled_Verified_Grade_J10 VARCHAR(128))")
-# Enrollment_Current_Status
-c.execute("CREATE TABLE IF NOT EXISTS Enrollment_Current_Status (Enrollment_Current_Status_id INTEGER PRIMARY KEY, Enrollment_Current_Status VARCHAR(128))")
-# Frozen_File_Extract
-c.execute("CREATE TABLE IF NOT EXISTS Frozen_File_Extract (Frozen_File_Extract_id INTEGER PRIMARY KEY, Frozen_File_Extract VARCHAR(128))")
-# Enrolled_Course_Subject
-c.execute("CREATE TABLE IF NOT EXISTS Enrolled_Course_Subject (Enrolled_Course_Subject_id INTEGER PRIMARY KEY, Enrolled_Course_Subject VARCHAR(128))")
-# Enrollment_Term
-c.execute("CREATE TABLE IF NOT EXISTS Enrollment_Term (Enrollment_Term_id INTEGER PRIMARY KEY, Enrollment_Term VARCHAR(128))")
-# Enrollment_Course_Current_Type_J10
-c.execute("CREATE TABLE IF NOT EXISTS Enrollment_Course_Current_Type_J10 (Enrollment_Course_Current_Type_J10_id INTEGER PRIMARY KEY, Enrollment_Course_Current_Type_J10 VARCHAR(128))")
-# Enrolled_Course_Full_Name_J10
-c.execute("CREATE TABLE IF NOT EXISTS Enrolled_Course_Full_Name_J10 (Enrolled_Course_Full_Name_J10_id INTEGER PRIMARY KEY, Enrolled_Course_Full_Name_J10 VARCHAR(128))")
-# Person_UIC_ID_J10_id
-c.execute("CREATE TABLE IF NOT EXISTS Person_UIC_ID_J10 (Person_UIC_ID_J10_id INTEGER PRIMARY KEY, Person_UIC_ID_J10 VARCHAR(128))")
-# Student_Current_Type
-c.execute("CREATE TABLE IF NOT EXISTS Student_Current_Type (Student_Current_Type_id INTEGER PRIMARY KEY, Student_Current_Type VARCHAR(128))")
-# Person_Gender
-c.execute("CREATE TABLE IF NOT EXISTS Person_Gender (Person_Gender_id INTEGER PRIMARY KEY, Person_Gender VARCHAR(128))")
-# Person_Race_1
-c.execute("CREATE TABLE IF NOT EXISTS Person_Race_1 (Person_Race_1_id INTEGER PRIMARY KEY, Person_Race_1 VARCHAR(128))")
-# Person_Ethnic_1
-c.execute("CREATE TABLE IF NOT EXISTS Person_Ethnic_1 (Person_Ethnic_1_id INTEGER PRIMARY KEY, Person_Ethnic_1 VARCHAR(128))")
-# Person_Address_Zip
-c.execute("CREATE TABLE IF NOT EXISTS Person_Address_Zip (Person_Address_Zip_id INTEGER PRIMARY KEY, Person_Address_Zip VARCHAR(128))")
-# College_Name
-c.execute("CREATE TABLE IF NOT EXISTS College_Name (College_Name_id INTEGER PRIMARY KEY, College_Name VARCHAR(128))")
-
-### multiple-field tables
-# Demographic_Entry
-c.execute("CREATE TABLE IF NOT EXISTS Demographic_Entry (Demographic_Entry_id INTEGER PRIMARY KEY, Person_ID_id INT, Person_UIC_ID_J10_id INT, Person_Birth_Date DATE, HS_Grad_Date DATE, Person_Address_Zip_id INT, Student_Current_Type_id INT, Person_Gender_id INT, Person_Race_1_id INT, Person_Ethnic_1_id INT, Frozen_File_Extract_id INT, Enrollment_Term_id INT)")
-# Course
-c.execute("CREATE TABLE IF NOT EXISTS Course (Course_id INTEGER PRIMARY KEY, Enrolled_Course_Name VARCHAR(128), Section_Credit_Value_J10 REAL, Billing_Cred_J10 REAL, Enrolled_Course_Subject_id INT)")
-# Course_Instance
-c.execute("CREATE TABLE IF NOT EXISTS Course_Instance (Course_Instance_id INTEGER PRIMARY KEY, Enrollment_Term_id INT, Enrollment_Course_Current_Type_J10_id INT, Enrolled_Course_Full_Name_J10_id INT, Enrollment_Term_Start_Date DATE, Course_id INT)")
-# Enrollment_Event
-c.execute("CREATE TABLE IF NOT EXISTS Enrollment_Event (Enrollment_Event_id INTEGER PRIMARY KEY, Person_ID_id INT, Enrolled_Verified_Grade_J10_id INT, Enrollment_Current_Status_id INT, Course_Instance_id INT, Enrolled_Course_Credit_Type_id INT, Frozen_File_Extract_id INT, Demographic_Entry_id INT)")
-# Other_Institution_Enrollment_Event
-c.execute("CREATE TABLE IF NOT EXISTS Other_Institution_Enrollment_Event (Other_Institution_Enrollment_Event_id INTEGER PRIMARY KEY, Person_ID_id INT, College_Name_id INT, Enrollment_Begin DATE, Enrollment_End DATE)")
+### SQL setting the end of the interval of each term (see Enrollment_Term_Interval below) to the day
+### before the next term's start, leaving the last term open
+# (the table isn't given an alias, which statements within triggers can't use)
+term_interval_ends = ('UPDATE Enrollment_Term_Interval SET End_Day = n.End_Day FROM (SELECT Enrollment_Term_id, '
+    'coalesce(lead(Start_Day) OVER (ORDER BY Start_Day, Enrollment_Term_id) - 1, 2147483647) AS End_Day FROM Enrollment_Term_Interval) n '
+    'WHERE n.Enrollment_Term_id = Enrollment_Term_Interval.Enrollment_Term_id AND Enrollment_Term_Interval.End_Day IS NOT n.End_Day')
+
+### SQL creating the necessary tables, indexes and triggers, if not already extant;
+### run in order by FrozenFileLoader.create_schema
+schema = [
+    ### single-field tables
+    # Enrolled_Course_Credit_Type
+    "CREATE TABLE IF NOT EXISTS Enrolled_Course_Credit_Type (Enrolled_Course_Credit_Type_id INTEGER PRIMARY KEY, Enrolled_Course_Credit_Type VARCHAR(128))",
+    # Person_ID
+    "CREATE TABLE IF NOT EXISTS Person_ID (Person_ID_id INTEGER PRIMARY KEY, Person_ID VARCHAR(128))",
+    # Enrolled_Verified_Grade_J10
+    "CREATE TABLE IF NOT EXISTS Enrolled_Verified_Grade_J10 (Enrolled_Verified_Grade_J10_id INTEGER PRIMARY KEY, Enrolled_Verified_Grade_J10 VARCHAR(128))",
+    # Enrollment_Current_Status
+    "CREATE TABLE IF NOT EXISTS Enrollment_Current_Status (Enrollment_Current_Status_id INTEGER PRIMARY KEY, Enrollment_Current_Status VARCHAR(128))",
+    # Frozen_File_Extract
+    "CREATE TABLE IF NOT EXISTS Frozen_File_Extract (Frozen_File_Extract_id INTEGER PRIMARY KEY, Frozen_File_Extract VARCHAR(128))",
+    # Enrolled_Course_Subject
+    "CREATE TABLE IF NOT EXISTS Enrolled_Course_Subject (Enrolled_Course_Subject_id INTEGER PRIMARY KEY, Enrolled_Course_Subject VARCHAR(128))",
+    # Enrollment_Term
+    "CREATE TABLE IF NOT EXISTS Enrollment_Term (Enrollment_Term_id INTEGER PRIMARY KEY, Enrollment_Term VARCHAR(128))",
+    # Enrollment_Course_Current_Type_J10
+    "CREATE TABLE IF NOT EXISTS Enrollment_Course_Current_Type_J10 (Enrollment_Course_Current_Type_J10_id INTEGER PRIMARY KEY, Enrollment_Course_Current_Type_J10 VARCHAR(128))",
+    # Enrolled_Course_Full_Name_J10
+    "CREATE TABLE IF NOT EXISTS Enrolled_Course_Full_Name_J10 (Enrolled_Course_Full_Name_J10_id INTEGER PRIMARY KEY, Enrolled_Course_Full_Name_J10 VARCHAR(128))",
+    # Person_UIC_ID_J10_id
+    "CREATE TABLE IF NOT EXISTS Person_UIC_ID_J10 (Person_UIC_ID_J10_id INTEGER PRIMARY KEY, Person_UIC_ID_J10 VARCHAR(128))",
+    # Student_Current_Type
+    "CREATE TABLE IF NOT EXISTS Student_Current_Type (Student_Current_Type_id INTEGER PRIMARY KEY, Student_Current_Type VARCHAR(128))",
+    # Person_Gender
+    "CREATE TABLE IF NOT EXISTS Person_Gender (Person_Gender_id INTEGER PRIMARY KEY, Person_Gender VARCHAR(128))",
+    # Person_Race_1
+    "CREATE TABLE IF NOT EXISTS Person_Race_1 (Person_Race_1_id INTEGER PRIMARY KEY, Person_Race_1 VARCHAR(128))",
+    # Person_Ethnic_1
+    "CREATE TABLE IF NOT EXISTS Person_Ethnic_1 (Person_Ethnic_1_id INTEGER PRIMARY KEY, Person_Ethnic_1 VARCHAR(128))",
+    # Person_Address_Zip
+    "CREATE TABLE IF NOT EXISTS Person_Address_Zip (Person_Address_Zip_id INTEGER PRIMARY KEY, Person_Address_Zip VARCHAR(128))",
+    # College_Name
+    "CREATE TABLE IF NOT EXISTS College_Name (College_Name_id INTEGER PRIMARY KEY, College_Name VARCHAR(128))",
+
+    ### multiple-field tables
+    # Demographic_Entry
+    "CREATE TABLE IF NOT EXISTS Demographic_Entry (Demographic_Entry_id INTEGER PRIMARY KEY, Person_ID_id INT, Person_UIC_ID_J10_id INT, Person_Birth_Date DATE, HS_Grad_Date DATE, Person_Address_Zip_id INT, Student_Current_Type_id INT, Person_Gender_id INT, Person_Race_1_id INT, Person_Ethnic_1_id INT, Frozen_File_Extract_id INT, Enrollment_Term_id INT)",
+    # Course
+    "CREATE TABLE IF NOT EXISTS Course (Course_id INTEGER PRIMARY KEY, Enrolled_Course_Name VARCHAR(128), Section_Credit_Value_J10 REAL, Billing_Cred_J10 REAL, Enrolled_Course_Subject_id INT)",
+    # Course_Instance
+    "CREATE TABLE IF NOT EXISTS Course_Instance (Course_Instance_id INTEGER PRIMARY KEY, Enrollment_Term_id INT, Enrollment_Course_Current_Type_J10_id INT, Enrolled_Course_Full_Name_J10_id INT, Enrollment_Term_Start_Date DATE, Course_id INT)",
+    # Enrollment_Event
+    "CREATE TABLE IF NOT EXISTS Enrollment_Event (Enrollment_Event_id INTEGER PRIMARY KEY, Person_ID_id INT, Enrolled_Verified_Grade_J10_id INT, Enrollment_Current_Status_id INT, Course_Instance_id INT, Enrolled_Course_Credit_Type_id INT, Frozen_File_Extract_id INT, Demographic_Entry_id INT)",
+    # Other_Institution_Enrollment_Event
+    "CREATE TABLE IF NOT EXISTS Other_Institution_Enrollment_Event (Other_Institution_Enrollment_Event_id INTEGER PRIMARY KEY, Person_ID_id INT, College_Name_id INT, Enrollment_Begin DATE, Enrollment_End DATE)",
+
+    ### interval index of enrollments at other institutions, for finding those overlapping or within a term (see RUN QUERIES below);
+    ### intervals are in days since 1970-01-01, as in the columnar export, and a missing begin or end leaves them open on that side
+    # Other_Institution_Enrollment_Interval, an R*Tree of the interval of each Other_Institution_Enrollment_Event, by its id,
+    # filled by the trigger below as the transfer files are loaded; the second statement fills it for events loaded before it existed
+    "CREATE VIRTUAL TABLE IF NOT EXISTS Other_Institution_Enrollment_Interval USING rtree_i32(Other_Institution_Enrollment_Event_id, Begin_Day, End_Day)",
+    "INSERT INTO Other_Institution_Enrollment_Interval SELECT Other_Institution_Enrollment_Event_id, min(b, e), max(b, e) FROM (SELECT Other_Institution_Enrollment_Event_id, coalesce(CAST(julianday(Enrollment_Begin) - 2440587.5 AS INT), -2147483648) AS b, coalesce(CAST(julianday(Enrollment_End) - 2440587.5 AS INT), 2147483647) AS e "
+    "FROM Other_Institution_Enrollment_Event) WHERE NOT EXISTS (SELECT 1 FROM Other_Institution_Enrollment_Interval)",
+    "CREATE TRIGGER IF NOT EXISTS Other_Institution_Enrollment_Event_interval AFTER INSERT ON Other_Institution_Enrollment_Event BEGIN INSERT INTO Other_Institution_Enrollment_Interval "
+    "SELECT NEW.Other_Institution_Enrollment_Event_id, min(b, e), max(b, e) FROM (SELECT coalesce(CAST(julianday(NEW.Enrollment_Begin) - 2440587.5 AS INT), -2147483648) AS b, coalesce(CAST(julianday(NEW.Enrollment_End) - 2440587.5 AS INT), 2147483647) AS e); END",
+    # Enrollment_Term_Interval, the interval of each term, from the start of its earliest course instance to the day before the next term's start;
+    # kept up to date by the trigger below, which only acts on a course instance starting a term earlier than it did, and filled by the second
+    # and third statements for course instances loaded before it existed
+    "CREATE TABLE IF NOT EXISTS Enrollment_Term_Interval (Enrollment_Term_id INTEGER PRIMARY KEY, Start_Day INT, End_Day INT)",
+    "INSERT INTO Enrollment_Term_Interval (Enrollment_Term_id, Start_Day) SELECT Enrollment_Term_id, min(CAST(julianday(Enrollment_Term_Start_Date) - 2440587.5 AS INT)) FROM Course_Instance "
+    "WHERE julianday(Enrollment_Term_Start_Date) IS NOT NULL AND NOT EXISTS (SELECT 1 FROM Enrollment_Term_Interval) GROUP BY Enrollment_Term_id",
+    term_interval_ends,
+    "CREATE TRIGGER IF NOT EXISTS Course_Instance_term_interval AFTER INSERT ON Course_Instance WHEN julianday(NEW.Enrollment_Term_Start_Date) IS NOT NULL AND NOT EXISTS (SELECT 1 FROM Enrollment_Term_Interval "
+    "WHERE Enrollment_Term_id = NEW.Enrollment_Term_id AND Start_Day <= CAST(julianday(NEW.Enrollment_Term_Start_Date) - 2440587.5 AS INT)) BEGIN "
+    "INSERT OR REPLACE INTO Enrollment_Term_Interval (Enrollment_Term_id, Start_Day) VALUES (NEW.Enrollment_Term_id, CAST(julianday(NEW.Enrollment_Term_Start_Date) - 2440587.5 AS INT)); " + term_interval_ends + "; END",
+
+    ### load manifest
+    # Frozen_File_Load, recording each csv file loaded so that unchanged files can be skipped on later runs
+    "CREATE TABLE IF NOT EXISTS Frozen_File_Load (Frozen_File_Load_id INTEGER PRIMARY KEY, File_Name VARCHAR(128), File_Size INT, File_Mtime REAL, File_Hash VARCHAR(64), Records INT, Loaded_At DATETIME)",
+
+    ### delta storage, used instead of Demographic_Entry and Enrollment_Event in "deltas" storage
+    # Demographic_Entry_Version, a demographic entry as in every extract from Valid_From_Extract_id to Valid_To_Extract_id
+    "CREATE TABLE IF NOT EXISTS Demographic_Entry_Version (Demographic_Entry_Version_id INTEGER PRIMARY KEY, Person_ID_id INT, Person_UIC_ID_J10_id INT, Person_Birth_Date DATE, HS_Grad_Date DATE, Person_Address_Zip_id INT, Student_Current_Type_id INT, Person_Gender_id INT, Person_Race_1_id INT, Person_Ethnic_1_id INT, Valid_From_Extract_id INT, Enrollment_Term_id INT, Valid_To_Extract_id INT)",
+    # Enrollment_Event_Version, an enrollment event as in every extract from Valid_From_Extract_id to Valid_To_Extract_id
+    "CREATE TABLE IF NOT EXISTS Enrollment_Event_Version (Enrollment_Event_Version_id INTEGER PRIMARY KEY, Person_ID_id INT, Enrolled_Verified_Grade_J10_id INT, Enrollment_Current_Status_id INT, Course_Instance_id INT, Enrolled_Course_Credit_Type_id INT, Valid_From_Extract_id INT, Valid_To_Extract_id INT)",
+    # Demographic_Entry_Snapshot and Enrollment_Event_Snapshot, the versions as the records of each extract they are in,
+    # with the columns of Demographic_Entry and Enrollment_Event; e.g. WHERE Frozen_File_Extract_id = 3 gives extract 3
+    "CREATE VIEW IF NOT EXISTS Demographic_Entry_Snapshot AS SELECT v.Demographic_Entry_Version_id AS Demographic_Entry_id, v.Person_ID_id, v.Person_UIC_ID_J10_id, v.Person_Birth_Date, v.HS_Grad_Date, v.Person_Address_Zip_id, "
+    "v.Student_Current_Type_id, v.Person_Gender_id, v.Person_Race_1_id, v.Person_Ethnic_1_id, x.Frozen_File_Extract_id, v.Enrollment_Term_id "
+    "FROM Demographic_Entry_Version v JOIN Frozen_File_Extract x ON x.Frozen_File_Extract_id BETWEEN v.Valid_From_Extract_id AND v.Valid_To_Extract_id",
+    "CREATE VIEW IF NOT EXISTS Enrollment_Event_Snapshot AS SELECT v.Enrollment_Event_Version_id AS Enrollment_Event_id, v.Person_ID_id, v.Enrolled_Verified_Grade_J10_id, v.Enrollment_Current_Status_id, v.Course_Instance_id, "
+    "v.Enrolled_Course_Credit_Type_id, x.Frozen_File_Extract_id, (SELECT d.Demographic_Entry_Version_id FROM Course_Instance ci JOIN Demographic_Entry_Version d ON d.Enrollment_Term_id = ci.Enrollment_Term_id "
+    "WHERE ci.Course_Instance_id = v.Course_Instance_id AND d.Person_ID_id = v.Person_ID_id AND x.Frozen_File_Extract_id BETWEEN d.Valid_From_Extract_id AND d.Valid_To_Extract_id) AS Demographic_Entry_id "
+    "FROM Enrollment_Event_Version v JOIN Frozen_File_Extract x ON x.Frozen_File_Extract_id BETWEEN v.Valid_From_Extract_id AND v.Valid_To_Extract_id",
+
+    ### materialized cohort tables, refreshed after each load (see COHORTS below)
+    # Person_Term_Summary, one row per person and term from their most recently loaded demographic entry for the term
+    "CREATE TABLE IF NOT EXISTS Person_Term_Summary (Person_Term_Summary_id INTEGER PRIMARY KEY, Person_ID_id INT, Enrollment_Term_id INT, Term_Start_Date DATE, Demographic_Entry_id INT, Frozen_File_Extract_id INT, Student_Current_Type_id INT, Courses INT, Credits_Attempted REAL, Credits_Earned REAL)",
+    # Person_Summary, one row per person with their first term, totals, latest demographic snapshot and transfer-out flag
+    "CREATE TABLE IF NOT EXISTS Person_Summary (Person_ID_id INTEGER PRIMARY KEY, First_Enrollment_Term_id INT, First_Term_Start_Date DATE, Terms_Enrolled INT, Credits_Attempted REAL, Credits_Earned REAL, Demographic_Entry_id INT, Person_UIC_ID_J10_id INT, Person_Birth_Date DATE, HS_Grad_Date DATE, Person_Address_Zip_id INT, Student_Current_Type_id INT, Person_Gender_id INT, Person_Race_1_id INT, Person_Ethnic_1_id INT, Transferred_Out INT)",
+    # Person_Timeline, one row per person with their transcript: their terms in order, each with its courses, and their enrollments at other institutions
+    "CREATE TABLE IF NOT EXISTS Person_Timeline (Person_ID_id INTEGER PRIMARY KEY, Timeline TEXT)",
+    # Cohort_Bitmap, the bitmap of the persons with each attribute, value and term, of the cohort tables (see COHORTS below)
+    "CREATE TABLE IF NOT EXISTS Cohort_Bitmap (Cohort_Bitmap_id INTEGER PRIMARY KEY, Attribute VARCHAR(32), Value_id INT, Enrollment_Term_id INT, Persons INT, Bitmap BLOB)",
+    # Cohort_Refresh_Queue, the persons whose summaries are out of date, filled by the triggers below as records are added
+    "CREATE TABLE IF NOT EXISTS Cohort_Refresh_Queue (Person_ID_id INTEGER PRIMARY KEY)",
+    "CREATE TRIGGER IF NOT EXISTS Demographic_Entry_refresh AFTER INSERT ON Demographic_Entry BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    "CREATE TRIGGER IF NOT EXISTS Enrollment_Event_refresh AFTER INSERT ON Enrollment_Event BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    "CREATE TRIGGER IF NOT EXISTS Other_Institution_Enrollment_Event_refresh AFTER INSERT ON Other_Institution_Enrollment_Event BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    # versions are also out of date for their person when they are found in another extract
+    "CREATE TRIGGER IF NOT EXISTS Demographic_Entry_Version_refresh AFTER INSERT ON Demographic_Entry_Version BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    "CREATE TRIGGER IF NOT EXISTS Demographic_Entry_Version_extended AFTER UPDATE OF Valid_To_Extract_id ON Demographic_Entry_Version BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    "CREATE TRIGGER IF NOT EXISTS Enrollment_Event_Version_refresh AFTER INSERT ON Enrollment_Event_Version BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+    "CREATE TRIGGER IF NOT EXISTS Enrollment_Event_Version_extended AFTER UPDATE OF Valid_To_Extract_id ON Enrollment_Event_Version BEGIN INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) VALUES (NEW.Person_ID_id); END",
+
+    ### unique indexes on the natural key of every table, so that lookups and
+    ### duplicate checks are index seeks and repeated rows are ignored on insert
+    # single-field tables
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrolled_Course_Credit_Type_key ON Enrolled_Course_Credit_Type (Enrolled_Course_Credit_Type)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_ID_key ON Person_ID (Person_ID)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrolled_Verified_Grade_J10_key ON Enrolled_Verified_Grade_J10 (Enrolled_Verified_Grade_J10)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrollment_Current_Status_key ON Enrollment_Current_Status (Enrollment_Current_Status)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Frozen_File_Extract_key ON Frozen_File_Extract (Frozen_File_Extract)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrolled_Course_Subject_key ON Enrolled_Course_Subject (Enrolled_Course_Subject)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrollment_Term_key ON Enrollment_Term (Enrollment_Term)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrollment_Course_Current_Type_J10_key ON Enrollment_Course_Current_Type_J10 (Enrollment_Course_Current_Type_J10)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrolled_Course_Full_Name_J10_key ON Enrolled_Course_Full_Name_J10 (Enrolled_Course_Full_Name_J10)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_UIC_ID_J10_key ON Person_UIC_ID_J10 (Person_UIC_ID_J10)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Student_Current_Type_key ON Student_Current_Type (Student_Current_Type)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_Gender_key ON Person_Gender (Person_Gender)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_Race_1_key ON Person_Race_1 (Person_Race_1)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_Ethnic_1_key ON Person_Ethnic_1 (Person_Ethnic_1)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_Address_Zip_key ON Person_Address_Zip (Person_Address_Zip)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS College_Name_key ON College_Name (College_Name)",
+    # multiple-field tables
+    "CREATE UNIQUE INDEX IF NOT EXISTS Demographic_Entry_key ON Demographic_Entry (Person_ID_id, Enrollment_Term_id, Frozen_File_Extract_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Course_key ON Course (Enrolled_Course_Name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Course_Instance_key ON Course_Instance (Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, Enrollment_Term_Start_Date, Course_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrollment_Event_key ON Enrollment_Event (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, Course_Instance_id, Demographic_Entry_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Other_Institution_Enrollment_Event_key ON Other_Institution_Enrollment_Event (Person_ID_id, College_Name_id, Enrollment_Begin, Enrollment_End)",
+    # load manifest
+    "CREATE UNIQUE INDEX IF NOT EXISTS Frozen_File_Load_key ON Frozen_File_Load (File_Name)",
+    # delta storage, whose natural keys include the last extract of the version, since a record has at most one version in each extract
+    "CREATE UNIQUE INDEX IF NOT EXISTS Demographic_Entry_Version_key ON Demographic_Entry_Version (Person_ID_id, Enrollment_Term_id, Valid_To_Extract_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Enrollment_Event_Version_key ON Enrollment_Event_Version (Person_ID_id, Course_Instance_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Valid_To_Extract_id)",
+    # materialized cohort tables
+    "CREATE UNIQUE INDEX IF NOT EXISTS Person_Term_Summary_key ON Person_Term_Summary (Person_ID_id, Enrollment_Term_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS Cohort_Bitmap_key ON Cohort_Bitmap (Attribute, Value_id, Enrollment_Term_id)",
+
+    ### covering indexes on the foreign keys that cohort queries join on
+    # (joins on Person_ID_id and Enrollment_Term_id alone are served by the leading columns above)
+    # Demographic_Entry by term and student type, e.g. first time in college students in a term
+    "CREATE INDEX IF NOT EXISTS Demographic_Entry_cohort ON Demographic_Entry (Enrollment_Term_id, Student_Current_Type_id, Person_ID_id)",
+    # Enrollment_Event from a demographic entry or a course instance
+    "CREATE INDEX IF NOT EXISTS Enrollment_Event_Demographic_Entry ON Enrollment_Event (Demographic_Entry_id, Course_Instance_id)",
+    "CREATE INDEX IF NOT EXISTS Enrollment_Event_Course_Instance ON Enrollment_Event (Course_Instance_id, Person_ID_id)",
+    # Course_Instance and Course from their course and subject
+    "CREATE INDEX IF NOT EXISTS Course_Instance_Course ON Course_Instance (Course_id, Enrollment_Term_id)",
+    "CREATE INDEX IF NOT EXISTS Course_Subject ON Course (Enrolled_Course_Subject_id, Course_id)",
+    # Other_Institution_Enrollment_Event by college
+    "CREATE INDEX IF NOT EXISTS Other_Institution_Enrollment_Event_College ON Other_Institution_Enrollment_Event (College_Name_id, Person_ID_id)",
+    # delta storage by extract, e.g. the versions in the latest extract
+    "CREATE INDEX IF NOT EXISTS Demographic_Entry_Version_extract ON Demographic_Entry_Version (Valid_To_Extract_id, Valid_From_Extract_id)",
+    "CREATE INDEX IF NOT EXISTS Enrollment_Event_Version_extract ON Enrollment_Event_Version (Valid_To_Extract_id, Valid_From_Extract_id)",
+    # Person_Term_Summary by term and student type
+    "CREATE INDEX IF NOT EXISTS Person_Term_Summary_cohort ON Person_Term_Summary (Enrollment_Term_id, Student_Current_Type_id, Person_ID_id)"
+]
+
+### bulk loading
+# pragmas set for the duration of a bulk load, and restored to their previous values
+# afterwards: a write-ahead log synced only at checkpoints, a 256 MB page cache, up to
+# 1 GB of the database memory-mapped, and temporary tables and indexes kept in memory
+bulk_pragmas = {
+    'journal_mode':'WAL',
+    'synchronous':'NORMAL',
+    'cache_size':-256 * 2**10,
+    'mmap_size':2**30,
+    'temp_store':'MEMORY'
+}
+
+# the covering indexes, which loads don't use, so that a bulk load can create them
+# after the data is in rather than update them row by row; the unique indexes are
+# always kept, since they are what makes repeated rows be ignored
+deferred_indexes = {re.search(r'EXISTS (\w+)', sql).group(1):sql for sql in schema if sql.startswith('CREATE INDEX')}
 
 
 
@@ -99,19 +300,6 @@ c.execute("CREATE TABLE IF NOT EXISTS Other_Institution_Enrollment_Event (Other_
 ################################## ADD DATA ####################################
 ################################################################################
 
-### read in list of csv files from specified data path
-all_files = os.listdir(data_path)
-csv_demographics_files = []
-csv_courses_taken_files = []
-csv_transfer_files = []
-for i in all_files:
-    if re.search('demographics', i) and re.search('\.csv$', i):
-        csv_demographics_files.append(i)
-    elif re.search('courses_taken', i) and re.search('\.csv$', i):
-        csv_courses_taken_files.append(i)
-    elif re.search('transfer', i) and re.search('\.csv$', i):
-        csv_transfer_files.append(i)
-
 ### establish dictionary of field abbreviations and sql statements
 # abbreviations for field names
 f = {
@@ -150,6 +338,7 @@ ids = {
         'ecfnJ10':'SELECT Enrolled_Course_Full_Name_J10_id FROM Enrolled_Course_Full_Name_J10 WHERE Enrolled_Course_Full_Name_J10 = (?)', # Enrolled Course Full Name (J10)
         'ecn':'SELECT Course_id FROM Course WHERE Enrolled_Course_Name = (?)', # Enrolled Course Name
         'de':'SELECT Demographic_Entry_id FROM Demographic_Entry WHERE Person_ID_id = (?) AND Enrollment_Term_id = (?) AND Frozen_File_Extract_id = (?)', # Demographic Entry
+        'dev':'SELECT Demographic_Entry_Version_id FROM Demographic_Entry_Version WHERE Person_ID_id = (?) AND Enrollment_Term_id = (?) AND (?) BETWEEN Valid_From_Extract_id AND Valid_To_Extract_id', # Demographic Entry Version
         'pid':'SELECT Person_ID_id FROM Person_ID WHERE Person_ID = (?)', # Person ID
         'evgJ10':'SELECT Enrolled_Verified_Grade_J10_id FROM Enrolled_Verified_Grade_J10 WHERE Enrolled_Verified_Grade_J10 = (?)', # Enrolled Verified Grade (J10)
         'ecs':'SELECT Enrollment_Current_Status_id FROM Enrollment_Current_Status WHERE Enrollment_Current_Status = (?)', # Enrollment Current Status (J10)
@@ -168,289 +357,1400 @@ ids = {
         'oiee':'SELECT Other_Institution_Enrollment_Event_id FROM Other_Institution_Enrollment_Event WHERE Person_ID_id = (?) AND College_Name_id = (?) AND Enrollment_Begin = (?) AND Enrollment_End = (?)' # Other Institution Enrollment Event
 }
 
-# SQL to insert new record
+# SQL to insert new record; rows whose natural key is already present are ignored
 ins = {
-        'et':'INSERT INTO Enrollment_Term (Enrollment_Term) VALUES (?)', # Enrollment Term
-        'ecctJ10':'INSERT INTO Enrollment_Course_Current_Type_J10 (Enrollment_Course_Current_Type_J10) VALUES (?)', # Enrollment Course Current Type (J10)
-        'ecfnJ10':'INSERT INTO Enrolled_Course_Full_Name_J10 (Enrolled_Course_Full_Name_J10) VALUES (?)', # Enrolled Course Full Name (J10)
-        'ecn':'INSERT INTO Course (Enrolled_Course_Name, Section_Credit_Value_J10, Billing_Cred_J10, Enrolled_Course_Subject_id) VALUES (?,?,?,?)', # Course/Enrolled Course Name
-        'de':'INSERT INTO Demographic_Entry (Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id) VALUES (?,?,?,?,?,?,?,?,?,?,?)', # Demographic Entry
-        'pid':'INSERT INTO Person_ID (Person_ID) VALUES (?)', # Person ID
-        'evgJ10':'INSERT INTO Enrolled_Verified_Grade_J10 (Enrolled_Verified_Grade_J10) VALUES (?)', # Enrolled Verified Grade (J10)
-        'ecs':'INSERT INTO Enrollment_Current_Status (Enrollment_Current_Status) VALUES (?)', # Enrollment Current Status
-        'ecct':'INSERT INTO Enrolled_Course_Credit_Type (Enrolled_Course_Credit_Type) VALUES (?)', # Enrolled Course Credit Type
-        'ci':'INSERT INTO Course_Instance (Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, Enrollment_Term_Start_Date, Course_id) VALUES (?,?,?,?,?)', # Course Instance
-        'ffe':'INSERT INTO Frozen_File_Extract (Frozen_File_Extract) VALUES (?)', # Frozen File Extract
-        'uic':'INSERT INTO Person_UIC_ID_J10 (Person_UIC_ID_J10) VALUES (?)', # Person UIC ID (J10)
-        'sct':'INSERT INTO Student_Current_Type (Student_Current_Type) VALUES (?)', # Student Current Type
-        'g':'INSERT INTO Person_Gender (Person_Gender) VALUES (?)', # Person Gender
-        'r1':'INSERT INTO Person_Race_1 (Person_Race_1) VALUES (?)', # Person Race 1
-        'e1':'INSERT INTO Person_Ethnic_1 (Person_Ethnic_1) VALUES (?)', # Person Ethnic 1
-        'z':'INSERT INTO Person_Address_Zip (Person_Address_Zip) VALUES (?)', # Person Address Zip
-        'ecsub':'INSERT INTO Enrolled_Course_Subject (Enrolled_Course_Subject) VALUES (?)', # Enrolled Course Subject
-        'ee':'INSERT INTO Enrollment_Event (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, Course_Instance_id, Demographic_Entry_id) VALUES (?,?,?,?,?,?,?)', # Enrollment Event
-        'cn':'INSERT INTO College_Name (College_Name) VALUES (?)', # College Name
-        'oiee':'INSERT INTO Other_Institution_Enrollment_Event (Person_ID_id, College_Name_id, Enrollment_Begin, Enrollment_End) VALUES (?,?,?,?)' # Other Institution Enrollment Event
+        'et':'INSERT OR IGNORE INTO Enrollment_Term (Enrollment_Term) VALUES (?)', # Enrollment Term
+        'ecctJ10':'INSERT OR IGNORE INTO Enrollment_Course_Current_Type_J10 (Enrollment_Course_Current_Type_J10) VALUES (?)', # Enrollment Course Current Type (J10)
+        'ecfnJ10':'INSERT OR IGNORE INTO Enrolled_Course_Full_Name_J10 (Enrolled_Course_Full_Name_J10) VALUES (?)', # Enrolled Course Full Name (J10)
+        'ecn':'INSERT OR IGNORE INTO Course (Enrolled_Course_Name, Section_Credit_Value_J10, Billing_Cred_J10, Enrolled_Course_Subject_id) VALUES (?,?,?,?)', # Course/Enrolled Course Name
+        'de':'INSERT OR IGNORE INTO Demographic_Entry (Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id) VALUES (?,?,?,?,?,?,?,?,?,?,?)', # Demographic Entry
+        'pid':'INSERT OR IGNORE INTO Person_ID (Person_ID) VALUES (?)', # Person ID
+        'evgJ10':'INSERT OR IGNORE INTO Enrolled_Verified_Grade_J10 (Enrolled_Verified_Grade_J10) VALUES (?)', # Enrolled Verified Grade (J10)
+        'ecs':'INSERT OR IGNORE INTO Enrollment_Current_Status (Enrollment_Current_Status) VALUES (?)', # Enrollment Current Status
+        'ecct':'INSERT OR IGNORE INTO Enrolled_Course_Credit_Type (Enrolled_Course_Credit_Type) VALUES (?)', # Enrolled Course Credit Type
+        'ci':'INSERT OR IGNORE INTO Course_Instance (Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, Enrollment_Term_Start_Date, Course_id) VALUES (?,?,?,?,?)', # Course Instance
+        'ffe':'INSERT OR IGNORE INTO Frozen_File_Extract (Frozen_File_Extract) VALUES (?)', # Frozen File Extract
+        'uic':'INSERT OR IGNORE INTO Person_UIC_ID_J10 (Person_UIC_ID_J10) VALUES (?)', # Person UIC ID (J10)
+        'sct':'INSERT OR IGNORE INTO Student_Current_Type (Student_Current_Type) VALUES (?)', # Student Current Type
+        'g':'INSERT OR IGNORE INTO Person_Gender (Person_Gender) VALUES (?)', # Person Gender
+        'r1':'INSERT OR IGNORE INTO Person_Race_1 (Person_Race_1) VALUES (?)', # Person Race 1
+        'e1':'INSERT OR IGNORE INTO Person_Ethnic_1 (Person_Ethnic_1) VALUES (?)', # Person Ethnic 1
+        'z':'INSERT OR IGNORE INTO Person_Address_Zip (Person_Address_Zip) VALUES (?)', # Person Address Zip
+        'ecsub':'INSERT OR IGNORE INTO Enrolled_Course_Subject (Enrolled_Course_Subject) VALUES (?)', # Enrolled Course Subject
+        'ee':'INSERT OR IGNORE INTO Enrollment_Event (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, Course_Instance_id, Demographic_Entry_id) VALUES (?,?,?,?,?,?,?)', # Enrollment Event
+        'cn':'INSERT OR IGNORE INTO College_Name (College_Name) VALUES (?)', # College Name
+        'oiee':'INSERT OR IGNORE INTO Other_Institution_Enrollment_Event (Person_ID_id, College_Name_id, Enrollment_Begin, Enrollment_End) VALUES (?,?,?,?)' # Other Institution Enrollment Event
+}
+
+# single-field lookup tables, by abbreviation
+lookup_tables = {
+    'pid':'Person_ID',
+    'et':'Enrollment_Term',
+    'ffe':'Frozen_File_Extract',
+    'uic':'Person_UIC_ID_J10',
+    'sct':'Student_Current_Type',
+    'g':'Person_Gender',
+    'r1':'Person_Race_1',
+    'e1':'Person_Ethnic_1',
+    'z':'Person_Address_Zip',
+    'ecsub':'Enrolled_Course_Subject',
+    'ecfnJ10':'Enrolled_Course_Full_Name_J10',
+    'ecctJ10':'Enrollment_Course_Current_Type_J10',
+    'evgJ10':'Enrolled_Verified_Grade_J10',
+    'ecs':'Enrollment_Current_Status',
+    'ecct':'Enrolled_Course_Credit_Type',
+    'cn':'College_Name'
+}
+
+# SQL to read whole tables into the cache, as (id, key...) rows
+warm = {abbr:'SELECT {0}_id, {0} FROM {0}'.format(table) for abbr, table in lookup_tables.items()}
+warm['ecn'] = 'SELECT Course_id, Enrolled_Course_Name FROM Course' # Course, keyed by Enrolled Course Name
+warm['ci'] = 'SELECT Course_Instance_id, Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, Enrollment_Term_Start_Date, Course_id FROM Course_Instance' # Course Instance, keyed by all five fields
+
+### functions for parsing dates
+# month/day/year, as in the demographics and courses_taken files, dropping any timestamp 0:00
+def parse_mdy_date(text):
+    date_elems = text.split(' ')[0].split('/')
+    return date(int(date_elems[2]), int(date_elems[0]), int(date_elems[1]))
+
+# YYYYMMDD, as in the NSC transfer files
+def parse_ymd_date(text):
+    return date(int(text[0:4]), int(text[4:6]), int(text[6:8]))
+
+### function for splitting a csv file into parts of whole lines, so that parts can be parsed independently
+# rows are assumed not to contain quoted line breaks, as is the case for the frozen file extracts
+def file_parts(path, part_size=part_size):
+    size = os.path.getsize(path)
+    with open(path, "rb") as fhand:
+        start = len(fhand.readline()) # skip the header
+        while start < size:
+            fhand.seek(start + part_size)
+            fhand.readline() # extend the part to the end of a line
+            stop = min(fhand.tell(), size)
+            yield (path, start, stop)
+            start = stop
+
+### function for reading the rows in one part of a csv file
+def read_part(path, start, stop):
+    with open(path, "rb") as fhand:
+        header = fhand.readline()
+        fhand.seek(start)
+        part = fhand.read(stop - start)
+    return csv.DictReader(io.TextIOWrapper(io.BytesIO(header + part)))
+
+### functions for parsing one part of a frozen file into records of plain values,
+### which can run in worker processes since they don't touch the database
+# lookup values of each type of record, in the order they appear in its records
+demographics_lookups = ('pid', 'et', 'uic', 'ffe', 'sct', 'g', 'r1', 'e1', 'z')
+courses_taken_lookups = ('pid', 'et', 'ffe', 'ecct', 'evgJ10', 'ecs', 'ecsub', 'ecfnJ10', 'ecctJ10')
+
+# demographics: lookup values, then Person Birth Date and HS Grad Date
+def parse_demographics(path, start, stop):
+    return [tuple(row[f[abbr]] for abbr in demographics_lookups) + (parse_mdy_date(row[f['bd']]), parse_mdy_date(row[f['hs']]))
+            for row in read_part(path, start, stop)]
+
+# courses_taken: lookup values, then Enrolled Course Name, Section Credit Value (J10), Billing Cred (J10) and Enrollment Term Start Date
+def parse_courses_taken(path, start, stop):
+    return [tuple(row[f[abbr]] for abbr in courses_taken_lookups) + (row[f['ecn']], row[f['scvJ10']], row[f['bcJ10']], str(parse_mdy_date(row[f['etsd']])))
+            for row in read_part(path, start, stop)]
+
+# transfers: Person ID, College Name, Enrollment Begin and Enrollment End, only
+# for NSC records that are indeed an enrollment event at another college
+def parse_transfers(path, start, stop):
+    return [(row[f['pid']], row[f['cn']], parse_ymd_date(row[f['eb']]), parse_ymd_date(row[f['ee']]))
+            for row in read_part(path, start, stop)
+            if row[f['rf']] == "Y" and row[f['grad?']] == "N" and row[f['cn']] != "Jackson College"]
+
+### function for parsing file parts, in order, in this process or a pool of workers
+def parse_all(tasks, workers=workers):
+    if workers is None:
+        for parse, path, start, stop in tasks:
+            yield parse(path, start, stop)
+        return
+    pool = ProcessPoolExecutor(workers)
+    try:
+        # keep a bounded number of parts parsed ahead of the writer
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(*task))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+### set-based alternatives to the add_* functions of FrozenFileLoader: each chunk of
+### records is copied into a TEMP staging table, then added with INSERT ... SELECT
+### statements that resolve the foreign keys in SQL; these neither use nor maintain the id cache
+
+### function for the joins from staging table columns, named by abbreviation, to single-field tables
+def lookup_joins(abbrs):
+    return ' '.join('JOIN {0} ON {0} = {1}'.format(lookup_tables[abbr], abbr) for abbr in abbrs)
+
+### function for the SQL adding the new values of a staging table column to its single-field table,
+### in order of first appearance so that ids are assigned as the row-at-a-time functions would
+def stage_lookup(stage, abbr):
+    return 'INSERT OR IGNORE INTO {0} ({0}) SELECT {1} FROM temp.{2} GROUP BY {1} ORDER BY min(rowid)'.format(lookup_tables[abbr], abbr, stage)
+
+# SQL for each staging table: its creation, the copy of a chunk of records into
+# it, and the statements adding its contents to the database in dependency order
+staging = {
+    'Demographics_Stage':(
+        'CREATE TEMP TABLE IF NOT EXISTS Demographics_Stage (pid, et, uic, ffe, sct, g, r1, e1, z, bd, hs)',
+        'INSERT INTO temp.Demographics_Stage VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+        [stage_lookup('Demographics_Stage', abbr) for abbr in demographics_lookups] + [
+            # Demographic Entry
+            'INSERT OR IGNORE INTO Demographic_Entry (Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id) '
+            'SELECT Person_ID_id, Person_UIC_ID_J10_id, bd, hs, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id '
+            'FROM temp.Demographics_Stage s ' + lookup_joins(demographics_lookups) + ' ORDER BY s.rowid'
+        ]),
+    'Courses_Taken_Stage':(
+        'CREATE TEMP TABLE IF NOT EXISTS Courses_Taken_Stage (pid, et, ffe, ecct, evgJ10, ecs, ecsub, ecfnJ10, ecctJ10, ecn, scvJ10, bcJ10, etsd)',
+        'INSERT INTO temp.Courses_Taken_Stage VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+        [
+            # only enrollment events with a corresponding demographic entry are added
+            'DELETE FROM temp.Courses_Taken_Stage WHERE rowid NOT IN (SELECT s.rowid FROM temp.Courses_Taken_Stage s ' + lookup_joins(('pid', 'et', 'ffe')) + ' '
+            'JOIN Demographic_Entry d ON d.Person_ID_id = Person_ID.Person_ID_id AND d.Enrollment_Term_id = Enrollment_Term.Enrollment_Term_id AND d.Frozen_File_Extract_id = Frozen_File_Extract.Frozen_File_Extract_id)'
+        ] + [stage_lookup('Courses_Taken_Stage', abbr) for abbr in courses_taken_lookups[3:]] + [
+            # Course
+            'INSERT OR IGNORE INTO Course (Enrolled_Course_Name, Section_Credit_Value_J10, Billing_Cred_J10, Enrolled_Course_Subject_id) '
+            'SELECT ecn, scvJ10, bcJ10, Enrolled_Course_Subject_id FROM temp.Courses_Taken_Stage s ' + lookup_joins(('ecsub',)) + ' ORDER BY s.rowid',
+            # Course Instance
+            'INSERT OR IGNORE INTO Course_Instance (Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, Enrollment_Term_Start_Date, Course_id) '
+            'SELECT Enrollment_Term_id, Enrollment_Course_Current_Type_J10_id, Enrolled_Course_Full_Name_J10_id, etsd, Course_id FROM temp.Courses_Taken_Stage s ' + lookup_joins(('et', 'ecctJ10', 'ecfnJ10')) + ' '
+            'JOIN Course ON Enrolled_Course_Name = ecn ORDER BY s.rowid',
+            # Enrollment Event
+            'INSERT OR IGNORE INTO Enrollment_Event (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, Course_Instance_id, Demographic_Entry_id) '
+            'SELECT d.Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, d.Frozen_File_Extract_id, Course_Instance_id, Demographic_Entry_id '
+            'FROM temp.Courses_Taken_Stage s ' + lookup_joins(courses_taken_lookups) + ' '
+            'JOIN Demographic_Entry d ON d.Person_ID_id = Person_ID.Person_ID_id AND d.Enrollment_Term_id = Enrollment_Term.Enrollment_Term_id AND d.Frozen_File_Extract_id = Frozen_File_Extract.Frozen_File_Extract_id '
+            'JOIN Course ON Enrolled_Course_Name = ecn '
+            'JOIN Course_Instance ci ON ci.Enrollment_Term_id = Enrollment_Term.Enrollment_Term_id AND ci.Enrollment_Course_Current_Type_J10_id = Enrollment_Course_Current_Type_J10.Enrollment_Course_Current_Type_J10_id '
+            'AND ci.Enrolled_Course_Full_Name_J10_id = Enrolled_Course_Full_Name_J10.Enrolled_Course_Full_Name_J10_id AND ci.Enrollment_Term_Start_Date = etsd AND ci.Course_id = Course.Course_id '
+            'ORDER BY s.rowid'
+        ]),
+    'Transfers_Stage':(
+        'CREATE TEMP TABLE IF NOT EXISTS Transfers_Stage (pid, cn, eb, ee)',
+        'INSERT INTO temp.Transfers_Stage VALUES (?,?,?,?)',
+        [stage_lookup('Transfers_Stage', abbr) for abbr in ('pid', 'cn')] + [
+            # Other Institution Enrollment Event
+            'INSERT OR IGNORE INTO Other_Institution_Enrollment_Event (Person_ID_id, College_Name_id, Enrollment_Begin, Enrollment_End) '
+            'SELECT Person_ID_id, College_Name_id, eb, ee FROM temp.Transfers_Stage s ' + lookup_joins(('pid', 'cn')) + ' ORDER BY s.rowid'
+        ])
+}
+
+# the staging table of the records from each parsing function
+staging_tables = {parse_demographics:'Demographics_Stage', parse_courses_taken:'Courses_Taken_Stage', parse_transfers:'Transfers_Stage'}
+
+### delta storage: rather than a row per extract, each demographic entry and enrollment event is
+### stored once per run of consecutive extracts it is unchanged in, extracts being ordered as they
+### were first loaded; a record extends the version of it valid in the previous extract if that is
+### unchanged, and is otherwise added as a new version, unless a version of it is already valid in
+### its extract (so that, as in snapshot storage, the first of duplicate records is the one kept)
+
+# SQL for the extract before the one given, if any
+prev_extract = '(SELECT max(Frozen_File_Extract_id) FROM Frozen_File_Extract WHERE Frozen_File_Extract_id < {0})'
+
+# SQL to extend the version of a record and, if none was extended, to insert a new version; the parameters
+# are those of ins['de'] and, without the Demographic_Entry_id, those of ins['ee']
+deltas = {
+    'de':(
+        'UPDATE Demographic_Entry_Version SET Valid_To_Extract_id = ?10 WHERE Person_ID_id = ?1 AND Enrollment_Term_id = ?11 AND Valid_To_Extract_id = ' + prev_extract.format('?10') + ' '
+        'AND Person_UIC_ID_J10_id IS ?2 AND Person_Birth_Date IS ?3 AND HS_Grad_Date IS ?4 AND Person_Address_Zip_id IS ?5 AND Student_Current_Type_id IS ?6 AND Person_Gender_id IS ?7 AND Person_Race_1_id IS ?8 AND Person_Ethnic_1_id IS ?9 '
+        'AND NOT EXISTS (SELECT 1 FROM Demographic_Entry_Version WHERE Person_ID_id = ?1 AND Enrollment_Term_id = ?11 AND ?10 BETWEEN Valid_From_Extract_id AND Valid_To_Extract_id)',
+        'INSERT OR IGNORE INTO Demographic_Entry_Version (Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Valid_From_Extract_id, Enrollment_Term_id, Valid_To_Extract_id) '
+        'SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?10 '
+        'WHERE NOT EXISTS (SELECT 1 FROM Demographic_Entry_Version WHERE Person_ID_id = ?1 AND Enrollment_Term_id = ?11 AND ?10 BETWEEN Valid_From_Extract_id AND Valid_To_Extract_id)'
+    ),
+    'ee':(
+        'UPDATE Enrollment_Event_Version SET Valid_To_Extract_id = ?5 WHERE Person_ID_id = ?1 AND Course_Instance_id = ?6 AND Enrolled_Verified_Grade_J10_id = ?2 AND Enrollment_Current_Status_id = ?3 AND Enrolled_Course_Credit_Type_id = ?4 '
+        'AND Valid_To_Extract_id = ' + prev_extract.format('?5') + ' '
+        'AND NOT EXISTS (SELECT 1 FROM Enrollment_Event_Version WHERE Person_ID_id = ?1 AND Course_Instance_id = ?6 AND Enrolled_Verified_Grade_J10_id = ?2 AND Enrollment_Current_Status_id = ?3 AND Enrolled_Course_Credit_Type_id = ?4 '
+        'AND ?5 BETWEEN Valid_From_Extract_id AND Valid_To_Extract_id)',
+        'INSERT OR IGNORE INTO Enrollment_Event_Version (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Valid_From_Extract_id, Course_Instance_id, Valid_To_Extract_id) '
+        'SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?5 '
+        'WHERE NOT EXISTS (SELECT 1 FROM Enrollment_Event_Version WHERE Person_ID_id = ?1 AND Course_Instance_id = ?6 AND Enrolled_Verified_Grade_J10_id = ?2 AND Enrollment_Current_Status_id = ?3 AND Enrolled_Course_Credit_Type_id = ?4 '
+        'AND ?5 BETWEEN Valid_From_Extract_id AND Valid_To_Extract_id)'
+    )
+}
+
+# SQL for the records of each staging table with their foreign keys resolved, as the columns of its version table
+staged_versions = {
+    'Demographics_Stage':'SELECT s.rowid, Person_ID_id, Person_UIC_ID_J10_id, bd AS Person_Birth_Date, hs AS HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, '
+        'Frozen_File_Extract_id, Enrollment_Term_id FROM temp.Demographics_Stage s ' + lookup_joins(demographics_lookups),
+    'Courses_Taken_Stage':'SELECT s.rowid, Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, ci.Course_Instance_id '
+        'FROM temp.Courses_Taken_Stage s ' + lookup_joins(courses_taken_lookups) + ' '
+        'JOIN Course ON Enrolled_Course_Name = ecn '
+        'JOIN Course_Instance ci ON ci.Enrollment_Term_id = Enrollment_Term.Enrollment_Term_id AND ci.Enrollment_Course_Current_Type_J10_id = Enrollment_Course_Current_Type_J10.Enrollment_Course_Current_Type_J10_id '
+        'AND ci.Enrolled_Course_Full_Name_J10_id = Enrolled_Course_Full_Name_J10.Enrolled_Course_Full_Name_J10_id AND ci.Enrollment_Term_Start_Date = etsd AND ci.Course_id = Course.Course_id'
+}
+
+# SQL for whether a version of the record s is already valid in its extract
+staged_version_exists = {
+    'Demographics_Stage':'EXISTS (SELECT 1 FROM Demographic_Entry_Version c WHERE c.Person_ID_id = s.Person_ID_id AND c.Enrollment_Term_id = s.Enrollment_Term_id '
+        'AND s.Frozen_File_Extract_id BETWEEN c.Valid_From_Extract_id AND c.Valid_To_Extract_id)',
+    'Courses_Taken_Stage':'EXISTS (SELECT 1 FROM Enrollment_Event_Version c WHERE c.Person_ID_id = s.Person_ID_id AND c.Course_Instance_id = s.Course_Instance_id AND c.Enrolled_Verified_Grade_J10_id = s.Enrolled_Verified_Grade_J10_id '
+        'AND c.Enrollment_Current_Status_id = s.Enrollment_Current_Status_id AND c.Enrolled_Course_Credit_Type_id = s.Enrolled_Course_Credit_Type_id AND s.Frozen_File_Extract_id BETWEEN c.Valid_From_Extract_id AND c.Valid_To_Extract_id)'
+}
+
+# the statements adding the contents of the demographics and courses_taken staging tables to delta
+# storage, in place of those of staging: the first run once, and the rest for each extract in the
+# staging table, in order, with its id as parameter, so that the versions a chunk adds for one extract
+# are extended by its records of the next; the updates only see one record of each key, as duplicates
+# are deleted first or (for enrollment events) identical
+staging_deltas = {
+    'Demographics_Stage':(staging['Demographics_Stage'][2][:-1] + [
+        # of duplicate records in the chunk, only the first is kept
+        'DELETE FROM temp.Demographics_Stage WHERE rowid NOT IN (SELECT min(rowid) FROM temp.Demographics_Stage GROUP BY pid, et, ffe)'
+    ], [
+        # Demographic Entry Version, extended
+        'UPDATE Demographic_Entry_Version AS v SET Valid_To_Extract_id = s.Frozen_File_Extract_id FROM (' + staged_versions['Demographics_Stage'] + ') AS s '
+        'WHERE v.Person_ID_id = s.Person_ID_id AND v.Enrollment_Term_id = s.Enrollment_Term_id AND v.Valid_To_Extract_id = ' + prev_extract.format('s.Frozen_File_Extract_id') + ' '
+        'AND v.Person_UIC_ID_J10_id IS s.Person_UIC_ID_J10_id AND v.Person_Birth_Date IS s.Person_Birth_Date AND v.HS_Grad_Date IS s.HS_Grad_Date AND v.Person_Address_Zip_id IS s.Person_Address_Zip_id '
+        'AND v.Student_Current_Type_id IS s.Student_Current_Type_id AND v.Person_Gender_id IS s.Person_Gender_id AND v.Person_Race_1_id IS s.Person_Race_1_id AND v.Person_Ethnic_1_id IS s.Person_Ethnic_1_id '
+        'AND NOT ' + staged_version_exists['Demographics_Stage'] + ' AND s.Frozen_File_Extract_id = (?)',
+        # Demographic Entry Version, new
+        'INSERT OR IGNORE INTO Demographic_Entry_Version (Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Valid_From_Extract_id, Enrollment_Term_id, Valid_To_Extract_id) '
+        'SELECT Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id, Frozen_File_Extract_id '
+        'FROM (' + staged_versions['Demographics_Stage'] + ') AS s WHERE NOT ' + staged_version_exists['Demographics_Stage'] + ' AND s.Frozen_File_Extract_id = (?) ORDER BY s.rowid'
+    ]),
+    'Courses_Taken_Stage':([
+        # only enrollment events with a corresponding demographic entry version are added
+        'DELETE FROM temp.Courses_Taken_Stage WHERE rowid NOT IN (SELECT s.rowid FROM temp.Courses_Taken_Stage s ' + lookup_joins(('pid', 'et', 'ffe')) + ' '
+        'JOIN Demographic_Entry_Version d ON d.Person_ID_id = Person_ID.Person_ID_id AND d.Enrollment_Term_id = Enrollment_Term.Enrollment_Term_id '
+        'AND Frozen_File_Extract.Frozen_File_Extract_id BETWEEN d.Valid_From_Extract_id AND d.Valid_To_Extract_id)'
+    ] + staging['Courses_Taken_Stage'][2][1:-1], [
+        # Enrollment Event Version, extended
+        'UPDATE Enrollment_Event_Version AS v SET Valid_To_Extract_id = s.Frozen_File_Extract_id FROM (' + staged_versions['Courses_Taken_Stage'] + ') AS s '
+        'WHERE v.Person_ID_id = s.Person_ID_id AND v.Course_Instance_id = s.Course_Instance_id AND v.Enrolled_Verified_Grade_J10_id = s.Enrolled_Verified_Grade_J10_id '
+        'AND v.Enrollment_Current_Status_id = s.Enrollment_Current_Status_id AND v.Enrolled_Course_Credit_Type_id = s.Enrolled_Course_Credit_Type_id '
+        'AND v.Valid_To_Extract_id = ' + prev_extract.format('s.Frozen_File_Extract_id') + ' AND NOT ' + staged_version_exists['Courses_Taken_Stage'] + ' AND s.Frozen_File_Extract_id = (?)',
+        # Enrollment Event Version, new
+        'INSERT OR IGNORE INTO Enrollment_Event_Version (Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Valid_From_Extract_id, Course_Instance_id, Valid_To_Extract_id) '
+        'SELECT Person_ID_id, Enrolled_Verified_Grade_J10_id, Enrollment_Current_Status_id, Enrolled_Course_Credit_Type_id, Frozen_File_Extract_id, Course_Instance_id, Frozen_File_Extract_id '
+        'FROM (' + staged_versions['Courses_Taken_Stage'] + ') AS s WHERE NOT ' + staged_version_exists['Courses_Taken_Stage'] + ' AND s.Frozen_File_Extract_id = (?) ORDER BY s.rowid'
+    ])
+}
+
+# SQL for the ids of the extracts in each staging table, in order
+staged_extracts = {table:'SELECT DISTINCT Frozen_File_Extract_id FROM temp.{0} JOIN Frozen_File_Extract ON Frozen_File_Extract = ffe ORDER BY Frozen_File_Extract_id'.format(table) for table in staging_deltas}
+
+### sharded loads (see load_sharded): the files of each extract are loaded by a worker process into
+### a shard database of their own, with the same schema, which is then attached to the main database
+### and merged into it; a shard's ids are its own, so each foreign key of its rows is mapped to the id
+### the main database has for the same row, found by the natural key of the table it refers to
+
+# the columns of each table, and the natural key of each table with a unique index, from the schema
+table_columns = {m.group(1):[column.split()[0] for column in m.group(2).split(', ')] for m in (re.match(r'CREATE TABLE IF NOT EXISTS (\w+) \((.*)\)$', sql) for sql in schema) if m}
+natural_keys = {m.group(2):m.group(3).split(', ') for m in (re.match(r'CREATE UNIQUE INDEX IF NOT EXISTS (\w+)_key ON (\w+) \((.*)\)$', sql) for sql in schema) if m}
+
+# the tables merged from a shard, in an order in which every table is merged after those its rows refer to,
+# and the ones whose rows are referred to, for which a temp.Merge_<table> map of shard ids to main ids is kept
+merged_tables = list(lookup_tables.values()) + ['Course', 'Course_Instance', 'Demographic_Entry', 'Enrollment_Event', 'Other_Institution_Enrollment_Event']
+mapped_tables = merged_tables[:-2]
+
+### function for the SQL selecting columns of the rows of a table of the shard, as s, with those that
+### are foreign keys (named for the table they refer to) mapped to the ids of the main database
+def merge_select(table, columns):
+    mapped = {k:column for k, column in enumerate(columns) if column != table + '_id' and column[:-3] in mapped_tables}
+    values = ', '.join('m%d.Main_id AS %s' % (k, column) if k in mapped else 's.%s' % column for k, column in enumerate(columns))
+    joins = ''.join(' JOIN temp.Merge_{0} m{1} ON m{1}.Shard_id = s.{2}'.format(column[:-3], k, column) for k, column in mapped.items())
+    return 'SELECT {0} FROM shard.{1} s{2}'.format(values, table, joins)
+
+# SQL merging the rows of each table of the shard, new ones first and in the order the shard added them, and then
+# mapping the ids of those referred to; with delta storage, demographic entries and enrollment events are instead
+# selected in order as the records of add_deltas
+merge = {table:[
+    'INSERT OR IGNORE INTO main.{0} ({1}) {2} ORDER BY s.{0}_id'.format(table, ', '.join(table_columns[table][1:]), merge_select(table, table_columns[table][1:]))
+] + ([
+    'DELETE FROM temp.Merge_' + table,
+    'INSERT INTO temp.Merge_{0} (Shard_id, Main_id) SELECT k.{0}_id, t.{0}_id FROM ({1}) k JOIN main.{0} t ON {2}'.format(table, merge_select(table, [table + '_id'] + natural_keys[table]),
+        ' AND '.join('t.{0} IS k.{0}'.format(column) for column in natural_keys[table]))
+] if table in mapped_tables else []) for table in merged_tables}
+merge_deltas = {
+    'de':merge_select('Demographic_Entry', table_columns['Demographic_Entry'][1:]) + ' ORDER BY s.Frozen_File_Extract_id, s.Demographic_Entry_id',
+    'ee':merge_select('Enrollment_Event', ['Person_ID_id', 'Enrolled_Verified_Grade_J10_id', 'Enrollment_Current_Status_id', 'Enrolled_Course_Credit_Type_id', 'Frozen_File_Extract_id', 'Course_Instance_id'])
+        + ' ORDER BY s.Frozen_File_Extract_id, s.Enrollment_Event_id'
+}
+
+### function for loading the files of one shard into its database, run by a worker process; returns the
+### number of records read from each file
+# the shard is loaded in bulk, and in snapshot storage whatever the storage of the main database
+def load_shard(data_path, settings, db_path, files):
+    with FrozenFileLoader(db_path, data_path, **settings) as loader:
+        with loader.bulk_load():
+            loaded, skipped = loader.load_frozen_files(*files)
+    return loaded
+
+### function for the content hash of a file, recorded in the load manifest
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as fhand:
+        for block in iter(lambda: fhand.read(2**20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+################################################################################
+################################### COHORTS ####################################
+################################################################################
+
+### materialized cohort tables
+# Person_Term_Summary and Person_Summary hold, per person and term and per person,
+# everything needed to pick out the usual analytical cohorts without joining the
+# fact tables; triggers queue every person whose demographic entries, enrollment
+# events or other institution enrollment events change, and refreshing the tables
+# recomputes the rows of just those persons
+
+### grades that earn no credit, and enrollment statuses whose credits aren't
+### attempted, as they appear in the frozen files
+no_credit_grades = ('F', 'W', 'I', 'NC')
+not_attempted_statuses = ('Dropped',)
+
+### function for the SQL of the timelines of the queued persons, given the SQL for the table of enrollment events e
+### and the condition of their being in the term of the Person_Term_Summary row t, with the course instance ci
+# a timeline is a JSON array of the person's terms and enrollments at other institutions, ordered by their start:
+#   {"term", "start", "student_type", "credits_attempted", "credits_earned", "courses":[{"course", "full_name",
+#    "subject", "credits", "grade", "status", "credit_type"}, ...]} for each term, with its courses in order of name, and
+#   {"college", "begin", "end"} for each enrollment at another institution
+# a term without courses starts when the term's earliest course instance does
+def timeline_sql(events, in_term):
+    return ('INSERT INTO Person_Timeline (Person_ID_id, Timeline) '
+        'SELECT q.Person_ID_id, (SELECT json_group_array(json(Item)) FROM ('
+        'SELECT coalesce(t.Term_Start_Date, (SELECT min(Enrollment_Term_Start_Date) FROM Course_Instance WHERE Enrollment_Term_id = t.Enrollment_Term_id)) AS Start, 0 AS Kind, et.Enrollment_Term AS Name, '
+        'json_object(\'term\', et.Enrollment_Term, \'start\', t.Term_Start_Date, \'student_type\', sct.Student_Current_Type, \'credits_attempted\', t.Credits_Attempted, \'credits_earned\', t.Credits_Earned, '
+        '\'courses\', (SELECT json_group_array(json(Course)) FROM (SELECT json_object(\'course\', co.Enrolled_Course_Name, \'full_name\', fn.Enrolled_Course_Full_Name_J10, \'subject\', sub.Enrolled_Course_Subject, '
+        '\'credits\', co.Section_Credit_Value_J10, \'grade\', g.Enrolled_Verified_Grade_J10, \'status\', s.Enrollment_Current_Status, \'credit_type\', ct.Enrolled_Course_Credit_Type) AS Course '
+        'FROM ' + events + ' e JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id JOIN Course co ON co.Course_id = ci.Course_id '
+        'LEFT JOIN Enrolled_Course_Full_Name_J10 fn ON fn.Enrolled_Course_Full_Name_J10_id = ci.Enrolled_Course_Full_Name_J10_id '
+        'LEFT JOIN Enrolled_Course_Subject sub ON sub.Enrolled_Course_Subject_id = co.Enrolled_Course_Subject_id '
+        'LEFT JOIN Enrolled_Verified_Grade_J10 g ON g.Enrolled_Verified_Grade_J10_id = e.Enrolled_Verified_Grade_J10_id '
+        'LEFT JOIN Enrollment_Current_Status s ON s.Enrollment_Current_Status_id = e.Enrollment_Current_Status_id '
+        'LEFT JOIN Enrolled_Course_Credit_Type ct ON ct.Enrolled_Course_Credit_Type_id = e.Enrolled_Course_Credit_Type_id '
+        'WHERE ' + in_term + ' ORDER BY co.Enrolled_Course_Name, g.Enrolled_Verified_Grade_J10, s.Enrollment_Current_Status, ct.Enrolled_Course_Credit_Type))) AS Item '
+        'FROM Person_Term_Summary t JOIN Enrollment_Term et ON et.Enrollment_Term_id = t.Enrollment_Term_id '
+        'LEFT JOIN Student_Current_Type sct ON sct.Student_Current_Type_id = t.Student_Current_Type_id WHERE t.Person_ID_id = q.Person_ID_id '
+        'UNION ALL '
+        'SELECT o.Enrollment_Begin, 1, cn.College_Name, json_object(\'college\', cn.College_Name, \'begin\', o.Enrollment_Begin, \'end\', o.Enrollment_End) '
+        'FROM Other_Institution_Enrollment_Event o JOIN College_Name cn ON cn.College_Name_id = o.College_Name_id WHERE o.Person_ID_id = q.Person_ID_id '
+        'ORDER BY Start, Kind, Name)) '
+        'FROM Cohort_Refresh_Queue q')
+
+# SQL for the timeline of a person, by Person ID
+timeline_lookup = 'SELECT Timeline FROM Person_Timeline WHERE Person_ID_id = (SELECT Person_ID_id FROM Person_ID WHERE Person_ID = (?))'
+
+# SQL to recompute the rows of the queued persons, in order; Person_Summary is built from Person_Term_Summary,
+# and the queue is cleared once the bitmap index is updated too (see below)
+refresh = [
+    'DELETE FROM Person_Term_Summary WHERE Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue)',
+    'DELETE FROM Person_Summary WHERE Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue)',
+    # per person and term: the most recently loaded extract's demographic entry and the enrollment events recorded against it
+    'INSERT INTO Person_Term_Summary (Person_ID_id, Enrollment_Term_id, Term_Start_Date, Demographic_Entry_id, Frozen_File_Extract_id, Student_Current_Type_id, Courses, Credits_Attempted, Credits_Earned) '
+    'SELECT d.Person_ID_id, d.Enrollment_Term_id, min(ci.Enrollment_Term_Start_Date), d.Demographic_Entry_id, d.Frozen_File_Extract_id, d.Student_Current_Type_id, count(e.Enrollment_Event_id), '
+    'total(CASE WHEN s.Enrollment_Current_Status IN ({0}) THEN 0 ELSE co.Section_Credit_Value_J10 END), '
+    'total(CASE WHEN s.Enrollment_Current_Status IN ({0}) OR g.Enrolled_Verified_Grade_J10 IN ({1}) THEN 0 ELSE co.Section_Credit_Value_J10 END) '
+    'FROM Cohort_Refresh_Queue q JOIN Demographic_Entry d ON d.Person_ID_id = q.Person_ID_id '
+    'LEFT JOIN Enrollment_Event e ON e.Demographic_Entry_id = d.Demographic_Entry_id '
+    'LEFT JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id '
+    'LEFT JOIN Course co ON co.Course_id = ci.Course_id '
+    'LEFT JOIN Enrollment_Current_Status s ON s.Enrollment_Current_Status_id = e.Enrollment_Current_Status_id '
+    'LEFT JOIN Enrolled_Verified_Grade_J10 g ON g.Enrolled_Verified_Grade_J10_id = e.Enrolled_Verified_Grade_J10_id '
+    'WHERE d.Frozen_File_Extract_id = (SELECT max(Frozen_File_Extract_id) FROM Demographic_Entry WHERE Person_ID_id = d.Person_ID_id AND Enrollment_Term_id = d.Enrollment_Term_id) '
+    'GROUP BY d.Demographic_Entry_id'.format(','.join('?' * len(not_attempted_statuses)), ','.join('?' * len(no_credit_grades))),
+    # per person: the first term with any courses, totals over the terms with courses, the most recently
+    # loaded demographic entry, and whether they enrolled at another institution since their first term
+    'INSERT INTO Person_Summary (Person_ID_id, First_Enrollment_Term_id, First_Term_Start_Date, Terms_Enrolled, Credits_Attempted, Credits_Earned, Demographic_Entry_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Transferred_Out) '
+    'SELECT q.Person_ID_id, f.Enrollment_Term_id, f.Term_Start_Date, coalesce(t.Terms, 0), coalesce(t.Attempted, 0), coalesce(t.Earned, 0), '
+    'd.Demographic_Entry_id, d.Person_UIC_ID_J10_id, d.Person_Birth_Date, d.HS_Grad_Date, d.Person_Address_Zip_id, d.Student_Current_Type_id, d.Person_Gender_id, d.Person_Race_1_id, d.Person_Ethnic_1_id, '
+    'EXISTS (SELECT 1 FROM Other_Institution_Enrollment_Event o WHERE o.Person_ID_id = q.Person_ID_id AND o.Enrollment_Begin >= coalesce(f.Term_Start_Date, \'\')) '
+    'FROM Cohort_Refresh_Queue q '
+    'LEFT JOIN (SELECT Person_ID_id, count(*) AS Terms, total(Credits_Attempted) AS Attempted, total(Credits_Earned) AS Earned FROM Person_Term_Summary '
+    'WHERE Courses > 0 AND Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue) GROUP BY Person_ID_id) t ON t.Person_ID_id = q.Person_ID_id '
+    'LEFT JOIN Person_Term_Summary f ON f.Person_Term_Summary_id = (SELECT Person_Term_Summary_id FROM Person_Term_Summary WHERE Person_ID_id = q.Person_ID_id AND Courses > 0 ORDER BY Term_Start_Date LIMIT 1) '
+    'LEFT JOIN Demographic_Entry d ON d.Demographic_Entry_id = (SELECT Demographic_Entry_id FROM Demographic_Entry WHERE Person_ID_id = q.Person_ID_id ORDER BY Frozen_File_Extract_id DESC, Demographic_Entry_id DESC LIMIT 1)',
+    # per person: the timeline, from Person_Term_Summary
+    'DELETE FROM Person_Timeline WHERE Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue)',
+    timeline_sql('Enrollment_Event', 'e.Demographic_Entry_id = t.Demographic_Entry_id')
+]
+
+# parameters of each statement above
+refresh_params = [(), (), not_attempted_statuses + not_attempted_statuses + no_credit_grades, (), (), ()]
+
+# the same, from delta storage: the latest demographic entry of a person and term is the version
+# valid in the last extract with one, and its enrollment events are those valid in that extract;
+# of a person's demographic entries in their latest extract, Person_Summary has the one of the
+# latest term by start date, as the entries of an extract aren't kept in the order of its file
+refresh_deltas = refresh[:2] + [
+    'INSERT INTO Person_Term_Summary (Person_ID_id, Enrollment_Term_id, Term_Start_Date, Demographic_Entry_id, Frozen_File_Extract_id, Student_Current_Type_id, Courses, Credits_Attempted, Credits_Earned) '
+    'SELECT d.Person_ID_id, d.Enrollment_Term_id, min(ci.Enrollment_Term_Start_Date), d.Demographic_Entry_Version_id, d.Valid_To_Extract_id, d.Student_Current_Type_id, count(e.Enrollment_Event_Version_id), '
+    'total(CASE WHEN s.Enrollment_Current_Status IN ({0}) THEN 0 ELSE co.Section_Credit_Value_J10 END), '
+    'total(CASE WHEN s.Enrollment_Current_Status IN ({0}) OR g.Enrolled_Verified_Grade_J10 IN ({1}) THEN 0 ELSE co.Section_Credit_Value_J10 END) '
+    'FROM Cohort_Refresh_Queue q JOIN Demographic_Entry_Version d ON d.Person_ID_id = q.Person_ID_id '
+    'LEFT JOIN (Enrollment_Event_Version e JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id) ON e.Person_ID_id = d.Person_ID_id AND ci.Enrollment_Term_id = d.Enrollment_Term_id '
+    'AND d.Valid_To_Extract_id BETWEEN e.Valid_From_Extract_id AND e.Valid_To_Extract_id '
+    'LEFT JOIN Course co ON co.Course_id = ci.Course_id '
+    'LEFT JOIN Enrollment_Current_Status s ON s.Enrollment_Current_Status_id = e.Enrollment_Current_Status_id '
+    'LEFT JOIN Enrolled_Verified_Grade_J10 g ON g.Enrolled_Verified_Grade_J10_id = e.Enrolled_Verified_Grade_J10_id '
+    'WHERE d.Valid_To_Extract_id = (SELECT max(Valid_To_Extract_id) FROM Demographic_Entry_Version WHERE Person_ID_id = d.Person_ID_id AND Enrollment_Term_id = d.Enrollment_Term_id) '
+    'GROUP BY d.Demographic_Entry_Version_id'.format(','.join('?' * len(not_attempted_statuses)), ','.join('?' * len(no_credit_grades))),
+    'INSERT INTO Person_Summary (Person_ID_id, First_Enrollment_Term_id, First_Term_Start_Date, Terms_Enrolled, Credits_Attempted, Credits_Earned, Demographic_Entry_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Transferred_Out) '
+    'SELECT q.Person_ID_id, f.Enrollment_Term_id, f.Term_Start_Date, coalesce(t.Terms, 0), coalesce(t.Attempted, 0), coalesce(t.Earned, 0), '
+    'd.Demographic_Entry_Version_id, d.Person_UIC_ID_J10_id, d.Person_Birth_Date, d.HS_Grad_Date, d.Person_Address_Zip_id, d.Student_Current_Type_id, d.Person_Gender_id, d.Person_Race_1_id, d.Person_Ethnic_1_id, '
+    'EXISTS (SELECT 1 FROM Other_Institution_Enrollment_Event o WHERE o.Person_ID_id = q.Person_ID_id AND o.Enrollment_Begin >= coalesce(f.Term_Start_Date, \'\')) '
+    'FROM Cohort_Refresh_Queue q '
+    'LEFT JOIN (SELECT Person_ID_id, count(*) AS Terms, total(Credits_Attempted) AS Attempted, total(Credits_Earned) AS Earned FROM Person_Term_Summary '
+    'WHERE Courses > 0 AND Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue) GROUP BY Person_ID_id) t ON t.Person_ID_id = q.Person_ID_id '
+    'LEFT JOIN Person_Term_Summary f ON f.Person_Term_Summary_id = (SELECT Person_Term_Summary_id FROM Person_Term_Summary WHERE Person_ID_id = q.Person_ID_id AND Courses > 0 ORDER BY Term_Start_Date LIMIT 1) '
+    'LEFT JOIN Demographic_Entry_Version d ON d.Demographic_Entry_Version_id = (SELECT v.Demographic_Entry_Version_id FROM Demographic_Entry_Version v '
+    'LEFT JOIN Person_Term_Summary pt ON pt.Person_ID_id = v.Person_ID_id AND pt.Enrollment_Term_id = v.Enrollment_Term_id '
+    'WHERE v.Person_ID_id = q.Person_ID_id ORDER BY v.Valid_To_Extract_id DESC, pt.Term_Start_Date DESC, v.Demographic_Entry_Version_id DESC LIMIT 1)',
+    refresh[4],
+    timeline_sql('Enrollment_Event_Version',
+        'e.Person_ID_id = t.Person_ID_id AND ci.Enrollment_Term_id = t.Enrollment_Term_id AND t.Frozen_File_Extract_id BETWEEN e.Valid_From_Extract_id AND e.Valid_To_Extract_id')
+]
+
+### cohort definitions, by attribute; attributes are the abbreviations of the
+### single-field tables in cohort_attributes, with a value or list of values as
+### they appear in the frozen files, plus
+#   'term': the term the cohort is enrolled in (with a demographic entry for it)
+#   'first_term': True for persons whose first term with courses is that term
+#   'transferred_out': True or False for persons who did or didn't enroll at another institution since their first term
+cohorts = {
+    'first_time_in_college':{'sct':'FTIC', 'first_term':True},
+    'first_time_in_college_transferred_out':{'sct':'FTIC', 'first_term':True, 'transferred_out':True}
+}
+
+# the column holding each attribute: Student Current Type is the one for the term
+# when a term is given, and otherwise, like the rest, from the latest demographic entry
+cohort_attributes = {
+    'sct':'Student_Current_Type_id',
+    'g':'Person_Gender_id',
+    'r1':'Person_Race_1_id',
+    'e1':'Person_Ethnic_1_id',
+    'z':'Person_Address_Zip_id'
+}
+
+### bitmap index of the cohort tables
+# for each attribute, value and term, a bitmap of the persons with it, in which bit i is set for
+# the person whose Person_ID_id is i; a cohort by several attributes is then found by ANDing, ORing
+# and NOTing a few bitmaps, and only the Person IDs of its members are read from the tables. The
+# bitmaps are Python ints, stored compressed with zlib in Cohort_Bitmap, and refresh_cohort_tables
+# updates them for the persons it refreshes. Value ids are those of the lookup tables, or 1 and 0
+# for true and false, and term ids those of Enrollment_Term, or 0 for attributes of no term
+
+# SQL for the (value id, term id, Person_ID_id) rows of the bitmaps of each attribute
+bitmap_sources = [
+    # every person, whom NOT is taken among
+    ('person', 'SELECT 1, 0, Person_ID_id FROM Person_Summary')
+] + [
+    # the attributes of the latest demographic entry
+    (abbr, 'SELECT {0}, 0, Person_ID_id FROM Person_Summary'.format(column)) for abbr, column in cohort_attributes.items()
+] + [
+    # Student Current Type in each term, and the terms with a demographic entry
+    ('sct', 'SELECT Student_Current_Type_id, Enrollment_Term_id, Person_ID_id FROM Person_Term_Summary'),
+    ('term', 'SELECT 1, Enrollment_Term_id, Person_ID_id FROM Person_Term_Summary'),
+    # the first term with courses
+    ('first_term', 'SELECT 1, First_Enrollment_Term_id, Person_ID_id FROM Person_Summary WHERE First_Enrollment_Term_id IS NOT NULL'),
+    # enrolled at another institution since the first term, and ever
+    ('transferred_out', 'SELECT Transferred_Out, 0, Person_ID_id FROM Person_Summary'),
+    ('other_institution', 'SELECT EXISTS (SELECT 1 FROM Other_Institution_Enrollment_Event o WHERE o.Person_ID_id = s.Person_ID_id), 0, Person_ID_id FROM Person_Summary s')
+]
+
+# SQL for one bitmap, and for the Person IDs of a list of Person_ID_ids given as JSON
+bitmap_sql = 'SELECT Bitmap FROM Cohort_Bitmap WHERE Attribute = (?) AND Value_id = (?) AND Enrollment_Term_id = (?)'
+bitmap_persons_sql = 'SELECT Person_ID FROM Person_ID WHERE Person_ID_id IN (SELECT value FROM json_each(?)) ORDER BY Person_ID_id'
+
+### functions for converting bitmaps: from a list of ids, to and from their compressed
+### form, and to the list of their ids
+def ids_bitmap(ids):
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+def pack_bitmap(bits):
+    return zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+
+def unpack_bitmap(packed):
+    return int.from_bytes(zlib.decompress(packed), 'little')
+
+def bitmap_ids(bits):
+    return [m.start() for m in re.finditer('1', bin(bits)[:1:-1])]
+
+### function for the bitmap of a cohort expression, read from the bitmap index on a connection;
+### expressions are nested tuples of
+#   ('and', expression, ...), ('or', expression, ...) and ('not', expression)
+# and of attributes, with values and terms as they appear in the frozen files:
+#   (abbr, value or list of values), for the abbreviations of cohort_attributes, from the latest demographic entry
+#   ('sct', value or list of values, term), with a Student Current Type in a term
+#   ('term', term), with a demographic entry for a term
+#   ('first_term', term), whose first term with courses is a term
+#   ('transferred_out', True or False) and ('other_institution', True or False), who did or didn't
+#   enroll at another institution since their first term, or ever
+# e.g. ('and', ('first_term', 'FA16'), ('sct', 'FTIC', 'FA16'), ('not', ('g', 'M')))
+def cohort_bitmap(conn, expression):
+    def bitmap(attribute, value_id, term_id):
+        packed = conn.execute(bitmap_sql, (attribute, value_id, term_id)).fetchone()
+        return 0 if packed is None else unpack_bitmap(packed[0])
+
+    def lookup(abbr, value):
+        found = conn.execute(ids[abbr], (value,)).fetchone()
+        return None if found is None else found[0]
+
+    op = expression[0]
+    if op in ('and', 'or'):
+        bits = None
+        for operand in expression[1:]:
+            if bits == 0 and op == 'and':
+                break
+            operand_bits = cohort_bitmap(conn, operand)
+            bits = operand_bits if bits is None else bits & operand_bits if op == 'and' else bits | operand_bits
+        return bits or 0
+    if op == 'not':
+        return bitmap('person', 1, 0) & ~cohort_bitmap(conn, expression[1])
+    if op in ('term', 'first_term'):
+        return bitmap(op, 1, lookup('et', expression[1]))
+    if op in ('transferred_out', 'other_institution'):
+        return bitmap(op, int(expression[1]), 0)
+    if op not in cohort_attributes:
+        raise ValueError("unknown cohort attribute: %r" % (op,))
+    values = [expression[1]] if isinstance(expression[1], str) else expression[1]
+    term_id = 0 if len(expression) == 2 else lookup('et', expression[2])
+    bits = 0
+    for value in values:
+        bits |= bitmap(op, lookup(op, value), term_id)
+    return bits
+
+### function for the Person IDs of the cohort of an expression (see cohort_bitmap), in order of Person_ID_id
+def find_bitmap_cohort(conn, expression):
+    return plain_list(conn.execute(bitmap_persons_sql, (json.dumps(bitmap_ids(cohort_bitmap(conn, expression))),)).fetchall())
+
+
+
+################################################################################
+#################################### EXPORT ####################################
+################################################################################
+
+### columnar export of the fact tables
+# each exported table becomes a directory of column files, one fixed-width binary
+# array per column in this machine's byte order, which model-building jobs can
+# memory-map (see load_columns) instead of reading rows through sqlite3; foreign
+# keys are exported as their integer ids, with the dimension codes of each row
+# already resolved, and the values behind the ids of each lookup table are
+# written as small JSON dictionaries; dates are days since 1970-01-01, as in
+# numpy's datetime64[D], and missing values are -1, or NaN for real numbers
+
+# array typecode, numpy dtype and missing value of each type of column
+column_types = {
+    'id':('i', 'i4', -1),
+    'date':('i', 'i4', -1),
+    'real':('d', 'f8', float('nan'))
+}
+
+# the ordinal of 1970-01-01, from which dates are counted
+epoch = date(1970, 1, 1).toordinal()
+
+# SQL for the rows of each exported table, and the type of each of its columns with
+# the abbreviation of the dictionary for its ids, if any
+exports = {
+    'Demographic_Entry':(
+        'SELECT Demographic_Entry_id, Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Frozen_File_Extract_id, Enrollment_Term_id '
+        'FROM Demographic_Entry ORDER BY Demographic_Entry_id',
+        [('Demographic_Entry_id', 'id', None), ('Person_ID_id', 'id', 'pid'), ('Person_UIC_ID_J10_id', 'id', 'uic'), ('Person_Birth_Date', 'date', None), ('HS_Grad_Date', 'date', None),
+         ('Person_Address_Zip_id', 'id', 'z'), ('Student_Current_Type_id', 'id', 'sct'), ('Person_Gender_id', 'id', 'g'), ('Person_Race_1_id', 'id', 'r1'), ('Person_Ethnic_1_id', 'id', 'e1'),
+         ('Frozen_File_Extract_id', 'id', 'ffe'), ('Enrollment_Term_id', 'id', 'et')]),
+    'Enrollment_Event':(
+        'SELECT e.Enrollment_Event_id, e.Person_ID_id, e.Enrolled_Verified_Grade_J10_id, e.Enrollment_Current_Status_id, e.Enrolled_Course_Credit_Type_id, e.Frozen_File_Extract_id, e.Demographic_Entry_id, e.Course_Instance_id, '
+        'ci.Enrollment_Term_id, ci.Enrollment_Course_Current_Type_J10_id, ci.Enrolled_Course_Full_Name_J10_id, ci.Enrollment_Term_Start_Date, ci.Course_id, co.Enrolled_Course_Subject_id, co.Section_Credit_Value_J10, co.Billing_Cred_J10 '
+        'FROM Enrollment_Event e LEFT JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id LEFT JOIN Course co ON co.Course_id = ci.Course_id ORDER BY e.Enrollment_Event_id',
+        [('Enrollment_Event_id', 'id', None), ('Person_ID_id', 'id', 'pid'), ('Enrolled_Verified_Grade_J10_id', 'id', 'evgJ10'), ('Enrollment_Current_Status_id', 'id', 'ecs'),
+         ('Enrolled_Course_Credit_Type_id', 'id', 'ecct'), ('Frozen_File_Extract_id', 'id', 'ffe'), ('Demographic_Entry_id', 'id', None), ('Course_Instance_id', 'id', None),
+         ('Enrollment_Term_id', 'id', 'et'), ('Enrollment_Course_Current_Type_J10_id', 'id', 'ecctJ10'), ('Enrolled_Course_Full_Name_J10_id', 'id', 'ecfnJ10'), ('Enrollment_Term_Start_Date', 'date', None),
+         ('Course_id', 'id', 'ecn'), ('Enrolled_Course_Subject_id', 'id', 'ecsub'), ('Section_Credit_Value_J10', 'real', None), ('Billing_Cred_J10', 'real', None)]),
+    'Demographic_Entry_Version':(
+        'SELECT Demographic_Entry_Version_id, Person_ID_id, Person_UIC_ID_J10_id, Person_Birth_Date, HS_Grad_Date, Person_Address_Zip_id, Student_Current_Type_id, Person_Gender_id, Person_Race_1_id, Person_Ethnic_1_id, Valid_From_Extract_id, Valid_To_Extract_id, Enrollment_Term_id '
+        'FROM Demographic_Entry_Version ORDER BY Demographic_Entry_Version_id',
+        [('Demographic_Entry_Version_id', 'id', None), ('Person_ID_id', 'id', 'pid'), ('Person_UIC_ID_J10_id', 'id', 'uic'), ('Person_Birth_Date', 'date', None), ('HS_Grad_Date', 'date', None),
+         ('Person_Address_Zip_id', 'id', 'z'), ('Student_Current_Type_id', 'id', 'sct'), ('Person_Gender_id', 'id', 'g'), ('Person_Race_1_id', 'id', 'r1'), ('Person_Ethnic_1_id', 'id', 'e1'),
+         ('Valid_From_Extract_id', 'id', 'ffe'), ('Valid_To_Extract_id', 'id', 'ffe'), ('Enrollment_Term_id', 'id', 'et')]),
+    'Enrollment_Event_Version':(
+        'SELECT e.Enrollment_Event_Version_id, e.Person_ID_id, e.Enrolled_Verified_Grade_J10_id, e.Enrollment_Current_Status_id, e.Enrolled_Course_Credit_Type_id, e.Valid_From_Extract_id, e.Valid_To_Extract_id, e.Course_Instance_id, '
+        'ci.Enrollment_Term_id, ci.Enrollment_Course_Current_Type_J10_id, ci.Enrolled_Course_Full_Name_J10_id, ci.Enrollment_Term_Start_Date, ci.Course_id, co.Enrolled_Course_Subject_id, co.Section_Credit_Value_J10, co.Billing_Cred_J10 '
+        'FROM Enrollment_Event_Version e LEFT JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id LEFT JOIN Course co ON co.Course_id = ci.Course_id ORDER BY e.Enrollment_Event_Version_id',
+        [('Enrollment_Event_Version_id', 'id', None), ('Person_ID_id', 'id', 'pid'), ('Enrolled_Verified_Grade_J10_id', 'id', 'evgJ10'), ('Enrollment_Current_Status_id', 'id', 'ecs'),
+         ('Enrolled_Course_Credit_Type_id', 'id', 'ecct'), ('Valid_From_Extract_id', 'id', 'ffe'), ('Valid_To_Extract_id', 'id', 'ffe'), ('Course_Instance_id', 'id', None),
+         ('Enrollment_Term_id', 'id', 'et'), ('Enrollment_Course_Current_Type_J10_id', 'id', 'ecctJ10'), ('Enrolled_Course_Full_Name_J10_id', 'id', 'ecfnJ10'), ('Enrollment_Term_Start_Date', 'date', None),
+         ('Course_id', 'id', 'ecn'), ('Enrolled_Course_Subject_id', 'id', 'ecsub'), ('Section_Credit_Value_J10', 'real', None), ('Billing_Cred_J10', 'real', None)]),
+    'Other_Institution_Enrollment_Event':(
+        'SELECT Other_Institution_Enrollment_Event_id, Person_ID_id, College_Name_id, Enrollment_Begin, Enrollment_End FROM Other_Institution_Enrollment_Event ORDER BY Other_Institution_Enrollment_Event_id',
+        [('Other_Institution_Enrollment_Event_id', 'id', None), ('Person_ID_id', 'id', 'pid'), ('College_Name_id', 'id', 'cn'), ('Enrollment_Begin', 'date', None), ('Enrollment_End', 'date', None)])
+}
+
+### function for converting a value as stored into its exported form
+def export_value(kind, value):
+    if kind == 'date':
+        return date.fromisoformat(value).toordinal() - epoch if value else -1
+    if kind == 'real':
+        return float(value) if isinstance(value, (int, float)) else column_types['real'][2]
+    return -1 if value is None else value
+
+### function for memory-mapping the columns of an exported table as NumPy arrays, by column name;
+### the dates in a column can be had as dates with .astype('datetime64[D]')
+def load_columns(path, table):
+    import numpy # only needed for reading an export back, so not required by the rest of this script
+    with open(os.path.join(path, 'columns.json')) as fhand:
+        description = json.load(fhand)['tables'][table]
+    return {name:numpy.memmap(os.path.join(path, column['file']), dtype=column['dtype'], mode='r', shape=(description['rows'],))
+            if description['rows'] else numpy.empty(0, column['dtype']) for name, column in description['columns'].items()}
+
+### function for reading an exported dictionary, as a dict of values by id
+def load_dictionary(path, dictionary):
+    with open(os.path.join(path, dictionary)) as fhand:
+        ids_values = json.load(fhand)
+    return dict(zip(ids_values['ids'], ids_values['values']))
+
+
+
+################################################################################
+#################################### LOADER ####################################
+################################################################################
+
+# the tables whose new rows are counted, and the table made from the records of each type of file, by storage
+counted_tables = list(lookup_tables.values()) + ['Course', 'Course_Instance', 'Demographic_Entry', 'Enrollment_Event', 'Demographic_Entry_Version', 'Enrollment_Event_Version', 'Other_Institution_Enrollment_Event']
+fact_tables = {
+    'snapshots':{parse_demographics:'Demographic_Entry', parse_courses_taken:'Enrollment_Event', parse_transfers:'Other_Institution_Enrollment_Event'},
+    'deltas':{parse_demographics:'Demographic_Entry_Version', parse_courses_taken:'Enrollment_Event_Version', parse_transfers:'Other_Institution_Enrollment_Event'}
 }
 
+# the tables or views with the demographic entries and enrollment events of each extract, by storage
+extract_tables = {
+    'snapshots':('Demographic_Entry', 'Enrollment_Event'),
+    'deltas':('Demographic_Entry_Snapshot', 'Enrollment_Event_Snapshot')
+}
+
+### function for the storage of the database on conn, at db_path: the one it holds demographic entries
+### in, else the one given, else the default storage; a storage given that isn't the one held is refused
+def database_storage(conn, db_path, given=None):
+    if given is not None and given not in storages:
+        raise ValueError("unknown storage: %r" % (given,))
+    for held in storages:
+        try:
+            if conn.execute('SELECT 1 FROM %s LIMIT 1' % fact_tables[held][parse_demographics]).fetchone() is None:
+                continue
+        except sqlite3.OperationalError: # no such table, before the schema is created
+            continue
+        if given not in (None, held):
+            raise ValueError("%s holds %s storage, not %s" % (db_path, held, given))
+        return held
+    return storage if given is None else given
+
+### a cursor counting the statements it runs, for instrumented loads: count, when set, is called with each
+### statement and the number of times it runs (once per set of parameters, for executemany)
+# while it runs them, issuing is set, as the trace reports the statements of their triggers as theirs
+class CountingCursor(sqlite3.Cursor):
+    count = None
+    issuing = False
+
+    def execute(self, sql, parameters=()):
+        if self.count is None:
+            return super().execute(sql, parameters)
+        self.count(sql, 1)
+        self.issuing = True
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.issuing = False
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.count is None:
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        self.count(sql, len(seq_of_parameters))
+        self.issuing = True
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.issuing = False
+
+### a loader of frozen files into one database
+# creating one only opens the database (or shares the connection given), so that
+# schedulers and notebooks can make one just to run the cohort and export functions;
+# the schema is created by create_schema, or else by the first load, and load_all or
+# the load_* functions of each type load the csv files found in data_path
+class FrozenFileLoader:
+
+    def __init__(self, db_path=db_path, data_path=data_path, chunk_size=chunk_size, workers=workers, part_size=part_size,
+                 load_engine=load_engine, storage=None, instrument=instrument, stats_path=stats_path, conn=None):
+        if load_engine not in load_engines:
+            raise ValueError("unknown load engine: %r" % (load_engine,))
+        self.db_path = db_path
+        self.data_path = data_path
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.part_size = part_size
+        self.load_engine = load_engine
+        self.instrument = instrument
+        self.stats_path = stats_path
+
+        ### create database connection, unless one is given to share, and a cursor object
+        self.own_conn = conn is None
+        self.conn = sqlite3.connect(db_path) if conn is None else conn
+        self.c = self.conn.cursor(CountingCursor)
+        self.schema_created = False
+
+        ### the storage of the database, which is that of the records it holds, if any (see database_storage)
+        try:
+            self.storage = database_storage(self.conn, db_path, storage)
+        except:
+            self.close()
+            raise
+        self.fact_tables = fact_tables[self.storage]
+
+        ### cache of lookup-table values and their ids
+        # every foreign key resolved during ingest goes through this cache, so that each
+        # lookup is a dict hit instead of a round trip to SQLite; it is warmed from the
+        # database when the schema is created and filled as new values are inserted
+        self.id_cache = {abbr:{} for abbr in warm}
+
+        ### statistics of the loads, filled in as they run
+        # seconds spent in each stage, in total and per file; per file, also the records
+        # read and the rows inserted into and skipped for each table; the number of
+        # commits; and, when instrumented, the number of SQL statements by kind and table
+        self.stats = {'stages':{}, 'files':{}, 'commits':0, 'statements':{}}
+
+        # the file being written, to which the time of stages is also attributed
+        self.loading_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ### function for closing the database connection, unless it was given to share
+    def close(self):
+        if self.own_conn:
+            self.conn.close()
+
+    ### function for creating the tables, indexes and triggers not already extant, and
+    ### warming the id cache from the database
+    # a database holds one storage, so one holding demographic entries in another storage
+    # than the loader's (as when another connection has loaded it since) is refused
+    def create_schema(self):
+        self.c.execute('PRAGMA journal_mode = ' + journal_mode)
+        # databases created before term intervals were stored have a view of them instead
+        if self.c.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'Enrollment_Term_Interval'").fetchone() is not None:
+            self.c.execute('DROP VIEW Enrollment_Term_Interval')
+        for sql in schema:
+            self.c.execute(sql)
+        self.conn.commit()
+        database_storage(self.conn, self.db_path, self.storage)
+        self.warm_id_cache()
+        self.schema_created = True
+
+    ### context manager for loading in bulk: the loads run within it with the bulk_pragmas
+    ### and, if defer_indexes, without the deferred_indexes, which are created at its end;
+    ### then the database is analyzed for the query planner and, if vacuum, vacuumed
+    # the indexes and previous pragmas are restored even if a load fails, but only a
+    # complete bulk load is analyzed and vacuumed
+    @contextmanager
+    def bulk_load(self, defer_indexes=True, vacuum=vacuum):
+        if not self.schema_created:
+            self.create_schema()
+        self.conn.commit() # pragmas like journal_mode can't be changed within a transaction
+        saved = {name:self.c.execute('PRAGMA ' + name).fetchone()[0] for name in bulk_pragmas}
+        for name, value in bulk_pragmas.items():
+            self.c.execute('PRAGMA %s = %s' % (name, value))
+        if defer_indexes:
+            for name in deferred_indexes:
+                self.c.execute('DROP INDEX IF EXISTS ' + name)
+        try:
+            yield self
+        finally:
+            if defer_indexes:
+                with self.stage('indexes'):
+                    for sql in deferred_indexes.values():
+                        self.c.execute(sql)
+            for name, value in saved.items():
+                self.c.execute('PRAGMA %s = %s' % (name, value))
+        with self.stage('analyze'):
+            self.c.execute('ANALYZE')
+            self.conn.commit()
+        if vacuum:
+            with self.stage('vacuum'):
+                self.c.execute('VACUUM')
+
+    ### context manager for timing a stage of the load, for the run and the file being written (or the given one)
+    @contextmanager
+    def stage(self, name, file=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats['stages'][name] = self.stats['stages'].get(name, 0.0) + seconds
+            file = self.loading_file if file is None else file
+            if file is not None:
+                stages = self.stats['files'].setdefault(file, {'stages':{}})['stages']
+                stages[name] = stages.get(name, 0.0) + seconds
 
-### read, parse, and add in data from demographics frozen files
-for i in csv_demographics_files:
-    with open(i, "r") as fhand:
-
-        reader = csv.DictReader(fhand)
-
-        for row in reader:
-            ### check whether demographic entry already added; iff not, insert it
-            try:
-                if len(c.execute(ids['de'], (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0], c.execute(
-                    ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0])).fetchall()) == 0:
-                    check = "insert"
-                else:
-                    check = "skip_insert"
-            except:
-                check = "insert"
-            if check == "insert":
-                ### add Person ID
-                if len(c.execute(ids['pid'], (row[f['pid']],)).fetchall()) == 0:
-                    c.execute(ins['pid'], (row[f['pid']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrollment Term
-                if len(c.execute(ids['et'], (row[f['et']],)).fetchall()) == 0:
-                    c.execute(ins['et'], (row[f['et']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Person UIC ID (J10)
-                if len(c.execute(ids['uic'], (row[f['uic']],)).fetchall()) == 0:
-                    c.execute(ins['uic'], (row[f['uic']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Frozen File Extract
-                if len(c.execute(ids['ffe'], (row[f['ffe']],)).fetchall()) == 0:
-                    c.execute(ins['ffe'], (row[f['ffe']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Student Current Type
-                if len(c.execute(ids['sct'], (row[f['sct']],)).fetchall()) == 0:
-                    c.execute(ins['sct'], (row[f['sct']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Person Gender
-                if len(c.execute(ids['g'], (row[f['g']],)).fetchall()) == 0:
-                    c.execute(ins['g'], (row[f['g']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Person Race 1
-                if len(c.execute(ids['r1'], (row[f['r1']],)).fetchall()) == 0:
-                    c.execute(ins['r1'], (row[f['r1']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Person Ethnic 1
-                if len(c.execute(ids['e1'], (row[f['e1']],)).fetchall()) == 0:
-                    c.execute(ins['e1'], (row[f['e1']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Person Address Zip
-                if len(c.execute(ids['z'], (row[f['z']],)).fetchall()) == 0:
-                    c.execute(ins['z'], (row[f['z']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Demographic Entry
-                # parsing Person Birth Date for inclusion in the insertion
-                bd_date = row[f['bd']].split(' ')[0] # drop any timestamp 0:00
-                bd_date_elems = bd_date.split('/')
-                bd_year = int(bd_date_elems[2])
-                bd_month = int(bd_date_elems[0])
-                bd_day = int(bd_date_elems[1])
-                # parsing HS Grad Date for inclusion in the insertion
-                hs_grad_date = row[f['hs']].split(' ')[0] # drop any timestamp 0:00
-                hs_grad_date_elems = hs_grad_date.split('/')
-                hs_year = int(hs_grad_date_elems[2])
-                hs_month = int(hs_grad_date_elems[0])
-                hs_day = int(hs_grad_date_elems[1])
-                c.execute(ins['de'], (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0], c.execute(ids['uic'], (row[f['uic']],)).fetchone()[0], date(bd_year, bd_month, bd_day), date(hs_year, hs_month, hs_day), c.execute(
-                    ids['z'], (row[f['z']],)).fetchone()[0], c.execute(ids['sct'], (row[f['sct']],)).fetchone()[0], c.execute(ids['g'], (row[f['g']],)).fetchone()[0], c.execute(
-                        ids['r1'], (row[f['r1']],)).fetchone()[0], c.execute(ids['e1'], (row[f['e1']],)).fetchone()[0], c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0], c.execute(
-                            ids['et'], (row[f['et']],)).fetchone()[0]))
-                conn.commit()
-    fhand.close()
-
-
-### read, parse, and add in data from courses_taken frozen files
-for i in csv_courses_taken_files:
-    with open(i, "r") as fhand:
-
-        reader = csv.DictReader(fhand)
-
-        for row in reader:
+    ### function for turning the counting of the statements run on or off
+    # those issued on the loader's cursor are counted there, and the trace counts those issued
+    # elsewhere on the connection, as by export_columns and merge_shard; the statements run by
+    # triggers aren't counted, as the trace reports them with the text of the statement that fired them
+    def count_statements(self, on):
+        self.c.count = self.count_statement if on else None
+        self.conn.set_trace_callback(self.count_traced if on else None)
+
+    ### function for counting a SQL statement run n times, by its kind and the table it names first
+    # statements that virtual tables, such as the R*Tree index, run for their own bookkeeping
+    # are reported as SQL comments, and counted apart as nested ones
+    def count_statement(self, sql, n=1):
+        nested = sql.lstrip().startswith('--')
+        if nested:
+            sql = sql.lstrip()[2:]
+        kind = sql.split(None, 1)[0].upper() if sql.strip() else sql
+        table = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF NOT EXISTS\s+)?(?:'?\w+'?\.)?'?(\w+)", sql, re.IGNORECASE)
+        if table is not None and kind != table.group(1).upper():
+            kind += ' ' + table.group(1)
+        if nested:
+            kind = 'nested ' + kind
+        self.stats['statements'][kind] = self.stats['statements'].get(kind, 0) + n
+
+    # statements reported by the trace, unless issued on the loader's cursor
+    def count_traced(self, sql):
+        if not self.c.issuing:
+            self.count_statement(sql)
+
+    ### function for the summary of the statistics, rounded and with the busiest items first
+    def stats_summary(self):
+        tables = {}
+        for file_stats in self.stats['files'].values():
+            for counted in ('inserted', 'skipped'):
+                for table, n in file_stats.get(counted, {}).items():
+                    tables.setdefault(table, {'inserted':0, 'skipped':0})[counted] += n
+        return {
+            'stages':{name:round(seconds, 3) for name, seconds in self.stats['stages'].items()},
+            'commits':self.stats['commits'],
+            'files':{i:dict(file_stats, stages={name:round(seconds, 3) for name, seconds in file_stats['stages'].items()}) for i, file_stats in self.stats['files'].items()},
+            'tables':dict(sorted(tables.items(), key=lambda t: -t[1]['inserted'])),
+            'statements':dict(sorted(self.stats['statements'].items(), key=lambda s: -s[1]))
+        }
+
+    ### function for reporting the summary, printed or written to stats_path
+    def report_stats(self):
+        summary = json.dumps(self.stats_summary(), indent=2)
+        if self.stats_path is None:
+            print(summary)
+        else:
+            with open(self.stats_path, "w") as fhand:
+                fhand.write(summary)
+
+    ### function for (re)loading the cache from the database
+    def warm_id_cache(self):
+        for abbr, sql in warm.items():
+            cache = self.id_cache[abbr]
+            cache.clear()
+            for r in self.c.execute(sql):
+                # keep the first id seen, as the id SELECTs' fetchone() would
+                cache.setdefault(r[1] if len(r) == 2 else tuple(r[1:]), r[0])
+
+    ### function for looking up the id of a value (or tuple of values) already stored
+    def lookup_id(self, abbr, key):
+        return self.id_cache[abbr].get(key)
+
+    ### function for inserting a value iff it is new, returning its id either way
+    # values are the insertion parameters when they differ from the cache key
+    def add_id(self, abbr, key, values=None):
+        cache = self.id_cache[abbr]
+        if key not in cache:
+            key_values = key if isinstance(key, tuple) else (key,)
+            self.c.execute(ins[abbr], key_values if values is None else values)
+            if self.c.rowcount == 1:
+                cache[key] = self.c.lastrowid
+            else:
+                # already stored, but by another connection since the cache was warmed
+                cache[key] = self.c.execute(ids[abbr], key_values).fetchone()[0]
+        return cache[key]
+
+    ### context manager for writing one chunk as a single transaction
+    # on failure the chunk is rolled back and the cache reloaded, since it may hold
+    # ids of lookup values whose insertion was just undone
+    @contextmanager
+    def transaction(self):
+        try:
+            yield
+            with self.stage('commit'):
+                self.conn.commit()
+            self.stats['commits'] += 1
+        except:
+            self.conn.rollback()
+            self.warm_id_cache()
+            raise
+
+
+    ### functions for adding parsed records to the database; only ever called by
+    ### the one process writing to it
+
+    # demographics frozen files
+    def add_demographics(self, records):
+        new_de = []
+        for r in records:
+            ### add Person ID, Enrollment Term, Person UIC ID (J10), Frozen File Extract,
+            ### Student Current Type, Person Gender, Person Race 1, Person Ethnic 1 and Person Address Zip
+            pid, et, uic, ffe, sct, g, r1, e1, z = (self.add_id(abbr, v) for abbr, v in zip(demographics_lookups, r))
+            ### add Demographic Entry, iff not already added for this person, term and extract
+            new_de.append((pid, uic, r[9], r[10], z, sct, g, r1, e1, ffe, et))
+        if self.storage == 'deltas':
+            self.add_deltas('de', new_de)
+        else:
+            self.c.executemany(ins['de'], new_de)
+
+    # courses_taken frozen files
+    def add_courses_taken(self, records):
+        new_ee = []
+        for r in records:
             ### check if enrollment event has corresponding demographic entry; iff so, insert enrollment event
-            try:
-                if len(c.execute(ids['de'], (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0], c.execute(ids['et'],(row[f['et']],)).fetchone()[0], c.execute(
-                    ids['ffe'], (row[f['ffe']],)).fetchone()[0])).fetchall()) != 0:
-                     demo_check = "insert"
-                else:
-                    demo_check = "skip_insert"
-            except:
-                demo_check = "skip_insert"
-            ### check if enrollment event already exists; iff not, insert enrollment event
-            try:
-                # parse Enrollment Term Start Date to use in checking for existing Course instances
-                etsd_date = row[f['etsd']].split(' ')[0] # drop any 0:00 timestamp
-                etsd_date_elems = etsd_date.split('/')
-                etsd_year = int(etsd_date_elems[2])
-                etsd_month = int(etsd_date_elems[0])
-                etsd_day = int(etsd_date_elems[1])
-                if len(
-                    c.execute(ids['ee'],
-                        (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0],
-                            c.execute(ids['evgJ10'], (row[f['evgJ10']],)).fetchone()[0],
-                                c.execute(ids['ecs'], (row[f['ecs']],)).fetchone()[0],
-                                    c.execute(ids['ecct'], (row[f['ecct']],)).fetchone()[0],
-                                        c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0],
-                                            c.execute(ids['ci'], (c.execute(ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ecctJ10'], (row[f['ecctJ10']],)).fetchone()[0], c.execute(ids['ecfnJ10'], (row[f['ecfnJ10']],)).fetchone()[0], date(etsd_year, etsd_month, etsd_day), c.execute(ids['ecn'], (row[f['ecn']],)).fetchone()[0])).fetchone()[0],
-                                                c.execute(ids['de'], (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0], c.execute(ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0])).fetchone()[0])).fetchall()) == 0:
-                    enroll_check = "insert"
-                else:
-                    enroll_check = "skip_insert"
-            except:
-                    enroll_check = "insert"
-            ### insert the record iff enrollment event has a corresponding demographic entry for that term and person
-            if demo_check == "insert" and enroll_check == "insert":
-                ### add Person ID
-                if len(c.execute(ids['pid'], (row[f['pid']],)).fetchall()) == 0:
-                    c.execute(ins['pid'], (row[f['pid']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrolled Course Credit Type
-                if len(c.execute(ids['ecct'], (row[f['ecct']],)).fetchall()) == 0:
-                    c.execute(ins['ecct'], (row[f['ecct']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrolled Verified Grade (J10)
-                if len(c.execute(ids['evgJ10'], (row[f['evgJ10']],)).fetchall()) == 0:
-                    c.execute(ins['evgJ10'], (row[f['evgJ10']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrollment Current Status
-                if len(c.execute(ids['ecs'], (row[f['ecs']],)).fetchall()) == 0:
-                    c.execute(ins['ecs'], (row[f['ecs']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Frozen File Extract
-                if len(c.execute(ids['ffe'], (row[f['ffe']],)).fetchall()) == 0:
-                    c.execute(ins['ffe'], (row[f['ffe']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrolled Course Subject
-                if len(c.execute(ids['ecsub'], (row[f['ecsub']],)).fetchall()) == 0:
-                    c.execute(ins['ecsub'], (row[f['ecsub']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrolled Course Full Name (J10)
-                if len(c.execute(ids['ecfnJ10'], (row[f['ecfnJ10']],)).fetchall()) == 0:
-                    c.execute(ins['ecfnJ10'], (row[f['ecfnJ10']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrollment Course Current Type (J10)
-                if len(c.execute(ids['ecctJ10'], (row[f['ecctJ10']],)).fetchall()) == 0:
-                    c.execute(ins['ecctJ10'], (row[f['ecctJ10']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrollment Term
-                if len(c.execute(ids['et'], (row[f['et']],)).fetchall()) == 0:
-                    c.execute(ins['et'], (row[f['et']],))
-                    conn.commit()
-                else:
-                    pass
-                ### add Course
-                if len(c.execute(ids['ecn'], (row[f['ecn']],)).fetchall()) == 0:
-                    c.execute(ins['ecn'], (row[f['ecn']], row[f['scvJ10']], row[f['bcJ10']], c.execute(ids['ecsub'], (row[f['ecsub']],)).fetchone()[0]))
-                    conn.commit()
-                else:
-                    pass
-                ### add Course Instance
-                if len(c.execute(ids['ci'], (c.execute(ids['et'], (
-                    row[f['et']],)).fetchone()[0], c.execute(ids['ecctJ10'], (
-                        row[f['ecctJ10']],)).fetchone()[0], c.execute(ids['ecfnJ10'], (row[f['ecfnJ10']],)).fetchone()[0], date(etsd_year, etsd_month, etsd_day), c.execute(ids['ecn'], (row[f['ecn']],)).fetchone()[0])).fetchall()) == 0:
-                    c.execute(ins['ci'], (c.execute(ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ecctJ10'], (
-                            row[f['ecctJ10']],)).fetchone()[0], c.execute(ids['ecfnJ10'], (row[f['ecfnJ10']],)).fetchone()[0], date(etsd_year, etsd_month, etsd_day), c.execute(ids['ecn'], (row[f['ecn']],)).fetchone()[0]))
-                    conn.commit()
-                else:
-                    pass
-                ### add Enrollment Event
-                c.execute(ins['ee'],
-                    (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0],
-                        c.execute(ids['evgJ10'], (row[f['evgJ10']],)).fetchone()[0],
-                            c.execute(ids['ecs'], (row[f['ecs']],)).fetchone()[0],
-                                c.execute(ids['ecct'], (row[f['ecct']],)).fetchone()[0],
-                                    c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0],
-                                        c.execute(ids['ci'], (c.execute(ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ecctJ10'], (row[f['ecctJ10']],)).fetchone()[0], c.execute(ids['ecfnJ10'], (row[f['ecfnJ10']],)).fetchone()[0], date(etsd_year, etsd_month, etsd_day), c.execute(ids['ecn'], (row[f['ecn']],)).fetchone()[0])).fetchone()[0],
-                                            c.execute(ids['de'], (c.execute(ids['pid'], (row[f['pid']],)).fetchone()[0], c.execute(ids['et'], (row[f['et']],)).fetchone()[0], c.execute(ids['ffe'], (row[f['ffe']],)).fetchone()[0])).fetchone()[0]))
-                conn.commit()
-    fhand.close()
-
-
-### read, parse, and add in data from NSC transfer files
-for i in csv_transfer_files:
-    with open(i, "r") as fhand:
-
-        reader = csv.DictReader(fhand)
-
-        for row in reader:
-            ### check that the NSC record is indeed an enrollment event at another college
-            if row[f['rf']] == "Y" and row[f['grad?']] == "N" and row[f['cn']] != "Jackson College":
-                try:
-                    if len(c.execute(ids['oiee'], (c.execute(ids['pid'], row[f['pid']]).fetchone()[0], c.execute(
-                        ids['cn'], (row[f['cn']],)).fetchone()[0], row[f['eb']], row[f['ee']])).fetchall()) == 0:
-                        check = "insert"
-                    else:
-                        check = "skip_insert"
-                except:
-                    check = "insert"
-                if check == "insert":
-                    ### add Person ID
-                    if len(c.execute(ids['pid'], (row[f['pid']],)).fetchall()) == 0:
-                        c.execute(ins['pid'], (row[f['pid']],))
-                        conn.commit()
-                    else:
-                        pass
-                    ### add College Name
-                    if len(c.execute(ids['cn'], (row[f['cn']],)).fetchall()) == 0:
-                        c.execute(ins['cn'], (row[f['cn']],))
-                        conn.commit()
+            pid, et, ffe = (self.lookup_id(abbr, v) for abbr, v in zip(courses_taken_lookups[:3], r))
+            de = None if None in (pid, et, ffe) else self.c.execute(ids['de' if self.storage == 'snapshots' else 'dev'], (pid, et, ffe)).fetchone()
+            if de is None:
+                continue
+            ### add Enrolled Course Credit Type, Enrolled Verified Grade (J10), Enrollment Current Status,
+            ### Enrolled Course Subject, Enrolled Course Full Name (J10) and Enrollment Course Current Type (J10)
+            ecct, evgJ10, ecs, ecsub, ecfnJ10, ecctJ10 = (self.add_id(abbr, v) for abbr, v in zip(courses_taken_lookups[3:], r[3:]))
+            ### add Course
+            course_id = self.add_id('ecn', r[9], (r[9], r[10], r[11], ecsub))
+            ### add Course Instance
+            ci_id = self.add_id('ci', (et, ecctJ10, ecfnJ10, r[12], course_id))
+            ### add Enrollment Event, iff not already added
+            new_ee.append((pid, evgJ10, ecs, ecct, ffe, ci_id, de[0]))
+        if self.storage == 'deltas':
+            self.add_deltas('ee', [ee[:6] for ee in new_ee])
+        else:
+            self.c.executemany(ins['ee'], new_ee)
+
+    # NSC transfer files
+    def add_transfers(self, records):
+        new_oiee = []
+        for r in records:
+            ### add Person ID and College Name
+            pid = self.add_id('pid', r[0])
+            cn = self.add_id('cn', r[1])
+            ### add Other Institution Enrollment Event, iff not already added
+            new_oiee.append((pid, cn, r[2], r[3]))
+        self.c.executemany(ins['oiee'], new_oiee)
+
+    # records for delta storage, in order, each extending the version of it valid in the previous
+    # extract or else inserted as a new version (see deltas)
+    def add_deltas(self, abbr, records):
+        extend, insert = deltas[abbr]
+        for r in records:
+            self.c.execute(extend, r)
+            if self.c.rowcount == 0:
+                self.c.execute(insert, r)
+
+    ### function for adding a chunk of parsed records through a staging table
+    def add_staged(self, table, records):
+        create, copy, add = staging[table]
+        self.c.execute(create)
+        self.c.executemany(copy, records)
+        if self.storage == 'deltas' and table in staging_deltas:
+            add, per_extract = staging_deltas[table]
+            for sql in add:
+                self.c.execute(sql)
+            for extract in plain_list(self.c.execute(staged_extracts[table]).fetchall()):
+                for sql in per_extract:
+                    self.c.execute(sql, (extract,))
+        else:
+            for sql in add:
+                self.c.execute(sql)
+        self.c.execute('DELETE FROM temp.' + table)
+
+    ### function for the function adding the records from a parsing function, with the load engine
+    def adder(self, parse):
+        if self.load_engine == 'staging':
+            return partial(self.add_staged, staging_tables[parse])
+        return {parse_demographics:self.add_demographics, parse_courses_taken:self.add_courses_taken, parse_transfers:self.add_transfers}[parse]
+
+    ### function for writing the parsed parts of one file, in transactions of chunk_size records;
+    ### returns the number of records written
+    def write_file(self, add, parts):
+        n = 0
+        if self.chunk_size is None:
+            with self.transaction():
+                for records in parts:
+                    add(records)
+                    n += len(records)
+        else:
+            for records in parts:
+                for k in range(0, len(records), self.chunk_size):
+                    with self.transaction():
+                        add(records[k:k + self.chunk_size])
+                n += len(records)
+        return n
+
+    ### functions for the load manifest
+    # check a file against the manifest, returning its (name, size, mtime, hash) if it
+    # is new or modified, or None if it is unchanged since it was last loaded; the
+    # file is only hashed when its size or mtime differ from the recorded ones
+    def manifest_check(self, path):
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        loaded = self.c.execute('SELECT File_Size, File_Mtime, File_Hash FROM Frozen_File_Load WHERE File_Name = (?)', (name,)).fetchone()
+        if loaded is not None and loaded[0] == stat.st_size and loaded[1] == stat.st_mtime:
+            return None
+        digest = file_hash(path)
+        if loaded is not None and loaded[0] == stat.st_size and loaded[2] == digest:
+            # touched but not modified; remember the new mtime to skip hashing next time
+            self.c.execute('UPDATE Frozen_File_Load SET File_Mtime = (?) WHERE File_Name = (?)', (stat.st_mtime, name))
+            self.conn.commit()
+            return None
+        return (name, stat.st_size, stat.st_mtime, digest)
+
+    # record a file as loaded, with the number of records read from it
+    def manifest_record(self, entry, records):
+        with self.transaction():
+            self.c.execute('INSERT OR REPLACE INTO Frozen_File_Load (File_Name, File_Size, File_Mtime, File_Hash, Records, Loaded_At) VALUES (?,?,?,?,?,?)',
+                entry + (records, datetime.now().isoformat(sep=' ', timespec='seconds')))
+
+    ### function for listing the csv files of each type in data_path, by name
+    def list_frozen_files(self):
+        files = {'demographics':[], 'courses_taken':[], 'transfer':[]}
+        for i in sorted(os.listdir(self.data_path)):
+            if re.search('demographics', i) and re.search(r'\.csv$', i):
+                files['demographics'].append(i)
+            elif re.search('courses_taken', i) and re.search(r'\.csv$', i):
+                files['courses_taken'].append(i)
+            elif re.search('transfer', i) and re.search(r'\.csv$', i):
+                files['transfer'].append(i)
+        return files
+
+    ### function for the number of rows added so far to each counted table, from its largest rowid
+    def table_rows(self):
+        self.count_statements(False) # not part of the load, so not counted
+        rows = {table:self.c.execute('SELECT max(rowid) FROM ' + table).fetchone()[0] or 0 for table in counted_tables}
+        self.count_statements(self.instrument)
+        return rows
+
+    ### function for parsing file parts in order, timing how long the writer waits for each;
+    ### closing it stops any workers still parsing ahead, as when a write fails
+    def timed_parse(self, tasks):
+        with closing(parse_all(tasks, self.workers)) as parsed:
+            for task in tasks:
+                with self.stage('parse', task[1]):
+                    records = next(parsed)
+                yield task, records
+
+    ### function for loading lists of frozen files of each type: files unchanged since
+    ### they were last loaded are skipped, and the rest are parsed and written in dependency
+    ### order; returns the number of records read from each file loaded, and the files skipped
+    def load_frozen_files(self, csv_demographics_files=(), csv_courses_taken_files=(), csv_transfer_files=()):
+        if not self.schema_created:
+            self.create_schema()
+        # files are opened from data_path, unless given by a full path
+        csv_demographics_files, csv_courses_taken_files, csv_transfer_files = (
+            [os.path.join(self.data_path, i) for i in files] for files in (csv_demographics_files, csv_courses_taken_files, csv_transfer_files))
+        self.count_statements(self.instrument)
+        with self.stage('load'):
+            ### check every file against the load manifest; only new or modified files are loaded
+            manifest = {}
+            skipped = []
+            with self.stage('manifest'):
+                for i in csv_demographics_files + csv_courses_taken_files + csv_transfer_files:
+                    entry = self.manifest_check(i)
+                    if entry is None:
+                        skipped.append(i)
                     else:
-                        pass
-                    ### add Other Institution Enrollment Event
-                    # parsing Enrollment Begin for inclusion in the insertion
-                    eb_year = int(row[f['eb']][0:4])
-                    eb_month = int(row[f['eb']][4:6])
-                    eb_day = int(row[f['eb']][6:8])
-                    # parsing Enrollment End for inclusion in the insertion
-                    ee_year = int(row[f['ee']][0:4])
-                    ee_month = int(row[f['ee']][4:6])
-                    ee_day = int(row[f['ee']][6:8])
-                    c.execute(ins['oiee'], (c.execute(ids['pid'], row[f['pid']]).fetchone()[0], c.execute(
-                        ids['cn'], (row[f['cn']],)).fetchone()[0], date(eb_year, eb_month, eb_day), date(ee_year, ee_month, ee_day)))
-                    conn.commit()
-    fhand.close()
+                        manifest[i] = entry
+
+            ### parse every part of every file, in the order they must be written: demographic entries
+            ### must be added before the enrollment events of courses_taken files can refer to them
+            tasks = [(parse_demographics,) + part for i in csv_demographics_files if i in manifest for part in file_parts(i, self.part_size)]
+            tasks += [(parse_courses_taken,) + part for i in csv_courses_taken_files if i in manifest for part in file_parts(i, self.part_size)]
+            tasks += [(parse_transfers,) + part for i in csv_transfer_files if i in manifest for part in file_parts(i, self.part_size)]
+            loaded = {}
+            with closing(self.timed_parse(tasks)) as parsed:
+                for (parse, i), parts in groupby(parsed, key=lambda p: p[0][:2]):
+                    before = self.table_rows()
+                    self.loading_file = i
+                    try:
+                        with self.stage('write'):
+                            loaded[i] = self.write_file(self.adder(parse), (records for task, records in parts))
+                            self.manifest_record(manifest[i], loaded[i])
+                    finally:
+                        self.loading_file = None
+                    after = self.table_rows()
+                    inserted = {table:after[table] - before[table] for table in counted_tables if after[table] != before[table]}
+                    self.stats['files'][i].update(records=loaded[i], inserted=inserted, skipped={self.fact_tables[parse]:loaded[i] - inserted.get(self.fact_tables[parse], 0)})
+            # files without any rows have no parts to write, but are loaded all the same
+            for i in manifest:
+                if i not in loaded:
+                    loaded[i] = 0
+                    self.manifest_record(manifest[i], 0)
+        return loaded, skipped
+
+    ### functions for loading the frozen files of one type, by default all those in data_path;
+    ### courses_taken files need the demographics files of the same extracts loaded first
+    def load_demographics(self, files=None):
+        return self.load_frozen_files(csv_demographics_files=self.list_frozen_files()['demographics'] if files is None else files)
+
+    def load_courses_taken(self, files=None):
+        return self.load_frozen_files(csv_courses_taken_files=self.list_frozen_files()['courses_taken'] if files is None else files)
+
+    def load_transfers(self, files=None):
+        return self.load_frozen_files(csv_transfer_files=self.list_frozen_files()['transfer'] if files is None else files)
+
+    ### function for loading all the frozen files in data_path
+    def load_all(self):
+        files = self.list_frozen_files()
+        return self.load_frozen_files(files['demographics'], files['courses_taken'], files['transfer'])
+
+    ### function for loading all the frozen files in data_path in shards: the new or modified files of
+    ### each extract (those named alike but for their type) and the transfer files are loaded in parallel,
+    ### by up to workers processes, into shard databases under shard_path (by default beside the database),
+    ### which are then merged into this one in the order of their files; returns what load_frozen_files does
+    # courses_taken files without a demographics file of their extract among those loaded are loaded
+    # once the shards are merged, as the demographic entries they need are only in this database
+    def load_sharded(self, shard_path=None, keep_shards=False):
+        if not self.schema_created:
+            self.create_schema()
+        self.count_statements(self.instrument)
+        files = self.list_frozen_files()
+        with self.stage('manifest'):
+            skipped = {i for names in files.values() for i in names if self.manifest_check(os.path.join(self.data_path, i)) is None}
+        shards = {}
+        for i in files['demographics']:
+            if i not in skipped:
+                shards.setdefault(i.replace('demographics', '', 1), ([], [], []))[0].append(i)
+        later = []
+        for i in files['courses_taken']:
+            if i in skipped:
+                continue
+            key = i.replace('courses_taken', '', 1)
+            if key in shards:
+                shards[key][1].append(i)
+            else:
+                later.append(i)
+        if any(i not in skipped for i in files['transfer']):
+            shards['transfer'] = ([], [], [i for i in files['transfer'] if i not in skipped])
+        shard_path = self.db_path + '.shards' if shard_path is None else shard_path
+        os.makedirs(shard_path, exist_ok=True)
+        paths = [os.path.join(shard_path, 'shard_%d.db' % k) for k in range(len(shards))]
+        for path in paths:
+            for stale in (path, path + '-wal', path + '-shm'):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+        ### load the shards in parallel, each in snapshot storage with this loader's other settings
+        settings = {'chunk_size':self.chunk_size, 'part_size':self.part_size, 'load_engine':self.load_engine, 'storage':'snapshots'}
+        loaded = {}
+        with self.stage('shards'):
+            with ProcessPoolExecutor(self.workers) as pool:
+                for shard_loaded in pool.map(partial(load_shard, self.data_path, settings), paths, [shards[key] for key in sorted(shards)]):
+                    loaded.update(shard_loaded)
+
+        ### merge them in order, then load the remaining courses_taken files
+        for path in paths:
+            with self.stage('merge'):
+                self.merge_shard(path)
+        self.warm_id_cache()
+        if later:
+            loaded.update(self.load_frozen_files(csv_courses_taken_files=later)[0])
+        if not keep_shards:
+            for path in paths:
+                os.remove(path)
+            if not os.listdir(shard_path):
+                os.rmdir(shard_path)
+        for i in loaded:
+            self.stats['files'].setdefault(i, {'stages':{}}).setdefault('records', loaded[i])
+        return loaded, [os.path.join(self.data_path, i) for names in files.values() for i in names if i in skipped]
+
+    ### function for merging the shard database at path into this one, with the load manifest of its files,
+    ### as one transaction; its new lookup values, courses and course instances are added, and its demographic
+    ### entries, enrollment events and other institution enrollment events with their foreign keys mapped
+    def merge_shard(self, path):
+        self.conn.commit() # databases can't be attached within a transaction
+        self.c.execute('ATTACH DATABASE (?) AS shard', (path,))
+        try:
+            with self.transaction():
+                for table in mapped_tables:
+                    self.c.execute('CREATE TEMP TABLE IF NOT EXISTS Merge_%s (Shard_id INTEGER PRIMARY KEY, Main_id INT)' % table)
+                for table in merged_tables:
+                    if self.storage == 'deltas' and table in ('Demographic_Entry', 'Enrollment_Event'):
+                        rows = self.conn.execute(merge_deltas['de' if table == 'Demographic_Entry' else 'ee'])
+                        for records in iter(partial(rows.fetchmany, self.chunk_size or 10000), []):
+                            self.add_deltas('de' if table == 'Demographic_Entry' else 'ee', records)
+                        continue
+                    for sql in merge[table]:
+                        self.c.execute(sql)
+                self.c.execute('INSERT OR REPLACE INTO main.Frozen_File_Load (File_Name, File_Size, File_Mtime, File_Hash, Records, Loaded_At) '
+                    'SELECT File_Name, File_Size, File_Mtime, File_Hash, Records, Loaded_At FROM shard.Frozen_File_Load ORDER BY Frozen_File_Load_id')
+        finally:
+            self.c.execute('DETACH DATABASE shard')
+
+    ### function for refreshing the materialized cohort tables and their bitmap index for the
+    ### queued persons, or for everyone when full (as when the tables are first created over existing data);
+    ### returns the number of persons refreshed
+    def refresh_cohort_tables(self, full=False):
+        if not self.schema_created:
+            self.create_schema()
+        with self.transaction():
+            if full or any(self.c.execute('SELECT 1 FROM %s LIMIT 1' % table).fetchone() is None for table in ('Person_Summary', 'Person_Timeline')):
+                self.c.execute('INSERT OR IGNORE INTO Cohort_Refresh_Queue (Person_ID_id) SELECT Person_ID_id FROM Person_ID')
+            n = self.c.execute('SELECT count(*) FROM Cohort_Refresh_Queue').fetchone()[0]
+            for sql, params in zip(refresh if self.storage == 'snapshots' else refresh_deltas, refresh_params):
+                self.c.execute(sql, params)
+            self.update_bitmaps(full)
+            self.c.execute('DELETE FROM Cohort_Refresh_Queue')
+        return n
+
+    ### function for updating the bitmap index for the queued persons, or for rebuilding it when
+    ### full or empty (as when it is first created over existing cohort tables); run by
+    ### refresh_cohort_tables once the cohort tables are refreshed
+    def update_bitmaps(self, full=False):
+        full = full or self.c.execute('SELECT 1 FROM Cohort_Bitmap LIMIT 1').fetchone() is None
+        ### the ids of the queued persons with each attribute, value and term
+        new = {}
+        for attribute, sql in bitmap_sources:
+            if not full:
+                sql = 'SELECT * FROM (%s) WHERE Person_ID_id IN (SELECT Person_ID_id FROM Cohort_Refresh_Queue)' % sql
+            for value_id, term_id, person in self.c.execute(sql):
+                if value_id is not None:
+                    new.setdefault((attribute, value_id, term_id), []).append(person)
+        ### the bitmaps they change: the bits of the queued persons are cleared from every
+        ### bitmap, and set again in those of their attributes
+        if full:
+            self.c.execute('DELETE FROM Cohort_Bitmap')
+            old = {}
+            queued = 0
+        else:
+            old = {tuple(r[:3]):r[3] for r in self.c.execute('SELECT Attribute, Value_id, Enrollment_Term_id, Bitmap FROM Cohort_Bitmap')}
+            queued = ids_bitmap(plain_list(self.c.execute('SELECT Person_ID_id FROM Cohort_Refresh_Queue').fetchall()))
+        for key in set(old) | set(new):
+            old_bits = unpack_bitmap(old[key]) if key in old else 0
+            bits = old_bits & ~queued | ids_bitmap(new.get(key))
+            if bits == old_bits:
+                continue
+            if bits:
+                self.c.execute('INSERT OR REPLACE INTO Cohort_Bitmap (Attribute, Value_id, Enrollment_Term_id, Persons, Bitmap) VALUES (?,?,?,?,?)',
+                    key + (bin(bits).count('1'), pack_bitmap(bits)))
+            else:
+                self.c.execute('DELETE FROM Cohort_Bitmap WHERE Attribute = (?) AND Value_id = (?) AND Enrollment_Term_id = (?)', key)
+
+    ### function for finding a cohort, by name or by attributes, in the materialized
+    ### cohort tables; returns the Person IDs in it
+    def find_cohort(self, name=None, **attributes):
+        if name is not None:
+            attributes = dict(cohorts[name], **attributes)
+        term = attributes.pop('term', None)
+        first_term = attributes.pop('first_term', False)
+        transferred_out = attributes.pop('transferred_out', None)
+        sql = 'SELECT p.Person_ID FROM Person_Summary s JOIN Person_ID p ON p.Person_ID_id = s.Person_ID_id'
+        where = []
+        params = []
+        if term is not None:
+            sql += ' JOIN Person_Term_Summary t ON t.Person_ID_id = s.Person_ID_id'
+            where.append('t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?))')
+            params.append(term)
+            if first_term:
+                where.append('s.First_Enrollment_Term_id = t.Enrollment_Term_id')
+        elif first_term:
+            raise ValueError("first_term needs a term")
+        if transferred_out is not None:
+            where.append('s.Transferred_Out = (?)')
+            params.append(int(transferred_out))
+        for abbr, values in attributes.items():
+            values = [values] if isinstance(values, str) else list(values)
+            column = ('t.' if term is not None and abbr == 'sct' else 's.') + cohort_attributes[abbr]
+            where.append('{0} IN (SELECT {1}_id FROM {1} WHERE {1} IN ({2}))'.format(column, lookup_tables[abbr], ','.join('?' * len(values))))
+            params.extend(values)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return plain_list(self.c.execute(sql, params).fetchall())
+
+    ### function for the timeline of a person, by Person ID, as of the last refresh of the cohort
+    ### tables (see timeline_sql); None for a person not in them
+    def timeline(self, person_id):
+        found = self.c.execute(timeline_lookup, (person_id,)).fetchone()
+        return None if found is None else json.loads(found[0])
+
+    ### function for finding a cohort by an expression over the bitmap index (see cohort_bitmap),
+    ### as of the last refresh of the cohort tables; returns the Person IDs in it
+    def bitmap_cohort(self, expression):
+        return find_bitmap_cohort(self.conn, expression)
+
+    ### function for exporting the fact tables and the dictionaries of their lookup tables
+    ### into a directory, reading them all from one snapshot of the database; returns the
+    ### description of the export, which is also written to columns.json in the directory
+    def export_columns(self, path, batch_size=100000):
+        byte_order = '<' if sys.byteorder == 'little' else '>'
+        description = {'tables':{}, 'dictionaries':{}}
+        os.makedirs(os.path.join(path, 'dictionaries'), exist_ok=True)
+        self.c.execute('BEGIN') # one snapshot for every table, even while another connection writes
+        try:
+            for table in self.fact_tables.values():
+                sql, columns = exports[table]
+                os.makedirs(os.path.join(path, table), exist_ok=True)
+                files = [open(os.path.join(path, table, name + '.bin'), 'wb') for name, kind, abbr in columns]
+                rows = 0
+                try:
+                    cursor = self.conn.execute(sql)
+                    batch = cursor.fetchmany(batch_size)
+                    while batch:
+                        rows += len(batch)
+                        for k, (name, kind, abbr) in enumerate(columns):
+                            array(column_types[kind][0], [export_value(kind, r[k]) for r in batch]).tofile(files[k])
+                        batch = cursor.fetchmany(batch_size)
+                finally:
+                    for fhand in files:
+                        fhand.close()
+                description['tables'][table] = {'rows':rows, 'columns':{name:{
+                    'file':'%s/%s.bin' % (table, name),
+                    'dtype':byte_order + column_types[kind][1],
+                    'dictionary':None if abbr is None else 'dictionaries/%s.json' % ('Course' if abbr == 'ecn' else lookup_tables[abbr])
+                } for name, kind, abbr in columns}}
+            ### dictionaries, as lists of ids and the values they stand for
+            for abbr in sorted({abbr for table in self.fact_tables.values() for name, kind, abbr in exports[table][1] if abbr is not None}):
+                ids_values = self.conn.execute(warm[abbr]).fetchall()
+                dictionary = 'dictionaries/%s.json' % ('Course' if abbr == 'ecn' else lookup_tables[abbr])
+                with open(os.path.join(path, dictionary), "w") as fhand:
+                    json.dump({'ids':[r[0] for r in ids_values], 'values':[r[1] for r in ids_values]}, fhand)
+                description['dictionaries'][dictionary] = len(ids_values)
+        finally:
+            self.conn.commit()
+        with open(os.path.join(path, 'columns.json'), "w") as fhand:
+            json.dump(description, fhand, indent=2)
+        return description
+
+    ### function for rebuilding the database as of one extract, by name, into a new database of
+    ### snapshot storage at db_path: its demographic entries and enrollment events are those of
+    ### the extract, with the ids of their versions in delta storage, and its other tables are
+    ### copies; returns the number of demographic entries and enrollment events rebuilt
+    # the cohort tables of the new database are left to its first refresh_cohort_tables
+    def rebuild_as_of(self, extract, db_path):
+        if not self.schema_created:
+            self.create_schema()
+        extract_id = self.c.execute(ids['ffe'], (extract,)).fetchone()
+        if extract_id is None:
+            raise ValueError("unknown extract: %r" % (extract,))
+        with FrozenFileLoader(db_path, storage='snapshots') as as_of:
+            as_of.create_schema()
+        self.conn.commit() # databases can't be attached within a transaction
+        self.c.execute('ATTACH DATABASE (?) AS as_of', (db_path,))
+        try:
+            with self.transaction():
+                for table in list(lookup_tables.values()) + ['Course', 'Course_Instance', 'Other_Institution_Enrollment_Event']:
+                    self.c.execute('INSERT INTO as_of.{0} SELECT * FROM main.{0}'.format(table))
+                rows = []
+                for table, source in zip(extract_tables['snapshots'], extract_tables[self.storage]):
+                    self.c.execute('INSERT INTO as_of.{0} SELECT * FROM main.{1} WHERE Frozen_File_Extract_id = (?)'.format(table, source), extract_id)
+                    rows.append(self.c.rowcount)
+        finally:
+            self.c.execute('DETACH DATABASE as_of')
+        return tuple(rows)
 
 
 
@@ -460,3 +1760,220 @@ for i in csv_transfer_files:
 
 # From here, after reading in real data, we could begin running queries for
 # all sorts of purposes.
+
+### querying alongside loads
+# a QueryPool holds read-only connections to the database, which in WAL mode each
+# read a consistent snapshot of it while a FrozenFileLoader writes, so analysts can
+# query during a nightly load without lock errors; its statements are fixed SQL with
+# parameters, which each connection prepares once and keeps in its statement cache
+
+# SQL of the common pulls
+queries = {
+    # Person IDs of the students of a term with a student type, as of their latest demographic entry for the term
+    'cohort':'SELECT p.Person_ID FROM Person_Term_Summary t JOIN Person_ID p ON p.Person_ID_id = t.Person_ID_id '
+        'WHERE t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?)) '
+        'AND t.Student_Current_Type_id = (SELECT Student_Current_Type_id FROM Student_Current_Type WHERE Student_Current_Type = (?)) ORDER BY p.Person_ID',
+    # a student's enrollments, from the latest extract of each term: term, term start date, course name, course full name,
+    # subject, section credit value, grade, status and credit type
+    'enrollments':'SELECT et.Enrollment_Term, ci.Enrollment_Term_Start_Date, co.Enrolled_Course_Name, fn.Enrolled_Course_Full_Name_J10, sub.Enrolled_Course_Subject, '
+        'co.Section_Credit_Value_J10, g.Enrolled_Verified_Grade_J10, s.Enrollment_Current_Status, ct.Enrolled_Course_Credit_Type '
+        'FROM Person_Term_Summary t JOIN Enrollment_Event e ON e.Demographic_Entry_id = t.Demographic_Entry_id '
+        'JOIN Enrollment_Term et ON et.Enrollment_Term_id = t.Enrollment_Term_id '
+        'JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id JOIN Course co ON co.Course_id = ci.Course_id '
+        'LEFT JOIN Enrolled_Course_Full_Name_J10 fn ON fn.Enrolled_Course_Full_Name_J10_id = ci.Enrolled_Course_Full_Name_J10_id '
+        'LEFT JOIN Enrolled_Course_Subject sub ON sub.Enrolled_Course_Subject_id = co.Enrolled_Course_Subject_id '
+        'LEFT JOIN Enrolled_Verified_Grade_J10 g ON g.Enrolled_Verified_Grade_J10_id = e.Enrolled_Verified_Grade_J10_id '
+        'LEFT JOIN Enrollment_Current_Status s ON s.Enrollment_Current_Status_id = e.Enrollment_Current_Status_id '
+        'LEFT JOIN Enrolled_Course_Credit_Type ct ON ct.Enrolled_Course_Credit_Type_id = e.Enrolled_Course_Credit_Type_id '
+        'WHERE t.Person_ID_id = (SELECT Person_ID_id FROM Person_ID WHERE Person_ID = (?)) ORDER BY ci.Enrollment_Term_Start_Date, co.Enrolled_Course_Name',
+    # transfer-outs of a term: the students with courses in the term who enrolled at another institution from its start on,
+    # with the college name, enrollment begin and enrollment end of each of those enrollments
+    'transfer_outs':'SELECT p.Person_ID, cn.College_Name, o.Enrollment_Begin, o.Enrollment_End FROM Person_Term_Summary t '
+        'JOIN Person_ID p ON p.Person_ID_id = t.Person_ID_id '
+        'JOIN Other_Institution_Enrollment_Event o ON o.Person_ID_id = t.Person_ID_id AND o.Enrollment_Begin >= t.Term_Start_Date '
+        'JOIN College_Name cn ON cn.College_Name_id = o.College_Name_id '
+        'WHERE t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?)) AND t.Courses > 0 '
+        'ORDER BY p.Person_ID, o.Enrollment_Begin',
+    # a student's timeline (see timeline_sql), as JSON
+    'timeline':timeline_lookup,
+    # enrollments at other institutions overlapping a term, and within a term, found through the interval index:
+    # Person ID, college name, enrollment begin and enrollment end
+    'enrolled_elsewhere':'SELECT p.Person_ID, cn.College_Name, o.Enrollment_Begin, o.Enrollment_End FROM Enrollment_Term_Interval t '
+        'JOIN Other_Institution_Enrollment_Interval i ON i.Begin_Day <= t.End_Day AND i.End_Day >= t.Start_Day '
+        'JOIN Other_Institution_Enrollment_Event o ON o.Other_Institution_Enrollment_Event_id = i.Other_Institution_Enrollment_Event_id '
+        'JOIN Person_ID p ON p.Person_ID_id = o.Person_ID_id JOIN College_Name cn ON cn.College_Name_id = o.College_Name_id '
+        'WHERE t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?)) ORDER BY p.Person_ID, o.Enrollment_Begin',
+    'enrolled_elsewhere_within':'SELECT p.Person_ID, cn.College_Name, o.Enrollment_Begin, o.Enrollment_End FROM Enrollment_Term_Interval t '
+        'JOIN Other_Institution_Enrollment_Interval i ON i.Begin_Day >= t.Start_Day AND i.End_Day <= t.End_Day '
+        'JOIN Other_Institution_Enrollment_Event o ON o.Other_Institution_Enrollment_Event_id = i.Other_Institution_Enrollment_Event_id '
+        'JOIN Person_ID p ON p.Person_ID_id = o.Person_ID_id JOIN College_Name cn ON cn.College_Name_id = o.College_Name_id '
+        'WHERE t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?)) ORDER BY p.Person_ID, o.Enrollment_Begin',
+    # concurrent enrollments of a term: the students with courses in the term who were enrolled at another institution during it,
+    # with the college name, enrollment begin and enrollment end of each of those enrollments
+    'concurrent_enrollments':'SELECT p.Person_ID, cn.College_Name, o.Enrollment_Begin, o.Enrollment_End FROM Enrollment_Term_Interval t '
+        'JOIN Other_Institution_Enrollment_Interval i ON i.Begin_Day <= t.End_Day AND i.End_Day >= t.Start_Day '
+        'JOIN Other_Institution_Enrollment_Event o ON o.Other_Institution_Enrollment_Event_id = i.Other_Institution_Enrollment_Event_id '
+        'JOIN Person_Term_Summary s ON s.Person_ID_id = o.Person_ID_id AND s.Enrollment_Term_id = t.Enrollment_Term_id AND s.Courses > 0 '
+        'JOIN Person_ID p ON p.Person_ID_id = o.Person_ID_id JOIN College_Name cn ON cn.College_Name_id = o.College_Name_id '
+        'WHERE t.Enrollment_Term_id = (SELECT Enrollment_Term_id FROM Enrollment_Term WHERE Enrollment_Term = (?)) ORDER BY p.Person_ID, o.Enrollment_Begin'
+}
+
+# the same, for a database of delta storage; the enrollments of a term are those valid in the extract of its demographic entry
+queries_deltas = dict(queries,
+    enrollments='SELECT et.Enrollment_Term, ci.Enrollment_Term_Start_Date, co.Enrolled_Course_Name, fn.Enrolled_Course_Full_Name_J10, sub.Enrolled_Course_Subject, '
+        'co.Section_Credit_Value_J10, g.Enrolled_Verified_Grade_J10, s.Enrollment_Current_Status, ct.Enrolled_Course_Credit_Type '
+        'FROM Person_Term_Summary t JOIN Enrollment_Event_Version e ON e.Person_ID_id = t.Person_ID_id AND t.Frozen_File_Extract_id BETWEEN e.Valid_From_Extract_id AND e.Valid_To_Extract_id '
+        'JOIN Enrollment_Term et ON et.Enrollment_Term_id = t.Enrollment_Term_id '
+        'JOIN Course_Instance ci ON ci.Course_Instance_id = e.Course_Instance_id AND ci.Enrollment_Term_id = t.Enrollment_Term_id JOIN Course co ON co.Course_id = ci.Course_id '
+        'LEFT JOIN Enrolled_Course_Full_Name_J10 fn ON fn.Enrolled_Course_Full_Name_J10_id = ci.Enrolled_Course_Full_Name_J10_id '
+        'LEFT JOIN Enrolled_Course_Subject sub ON sub.Enrolled_Course_Subject_id = co.Enrolled_Course_Subject_id '
+        'LEFT JOIN Enrolled_Verified_Grade_J10 g ON g.Enrolled_Verified_Grade_J10_id = e.Enrolled_Verified_Grade_J10_id '
+        'LEFT JOIN Enrollment_Current_Status s ON s.Enrollment_Current_Status_id = e.Enrollment_Current_Status_id '
+        'LEFT JOIN Enrolled_Course_Credit_Type ct ON ct.Enrolled_Course_Credit_Type_id = e.Enrolled_Course_Credit_Type_id '
+        'WHERE t.Person_ID_id = (SELECT Person_ID_id FROM Person_ID WHERE Person_ID = (?)) ORDER BY ci.Enrollment_Term_Start_Date, co.Enrolled_Course_Name'
+)
+
+### a pool of read-only connections to one database, and of threads running queries on them
+class QueryPool:
+
+    def __init__(self, db_path=db_path, size=4, storage=None):
+        self.db_path = db_path
+        self.size = size
+        # connections not in use; each is used by one thread at a time, but not always the same one
+        self.idle = queue.Queue()
+        uri = Path(os.path.abspath(db_path)).as_uri() + '?mode=ro'
+        for k in range(size):
+            self.idle.put(sqlite3.connect(uri, uri=True, check_same_thread=False))
+        # the queries of the storage of the database (see database_storage)
+        try:
+            with self.connection() as conn:
+                self.storage = database_storage(conn, db_path, storage)
+        except:
+            for k in range(size):
+                self.idle.get().close()
+            raise
+        self.queries = queries if self.storage == 'snapshots' else queries_deltas
+        self.executor = ThreadPoolExecutor(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ### function for closing the connections, once the queries running have finished
+    def close(self):
+        self.executor.shutdown()
+        for k in range(self.size):
+            self.idle.get().close()
+
+    ### context manager for borrowing a connection, waiting for one if all are in use
+    @contextmanager
+    def connection(self):
+        conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    ### function for running a query, as one snapshot of the database; returns its rows
+    def query(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    ### function for running a batch of (sql, params) queries in parallel on the pool's
+    ### threads, each as its own snapshot; returns the rows of each, in order
+    def query_batch(self, batch):
+        return list(self.executor.map(lambda q: self.query(*q), batch))
+
+    ### functions for the common pulls (see queries above)
+    # Person IDs of a cohort by term and student type
+    def cohort(self, term, student_type):
+        return plain_list(self.query(self.queries['cohort'], (term, student_type)))
+
+    # a student's enrollments, by Person ID
+    def enrollments(self, person_id):
+        return self.query(self.queries['enrollments'], (person_id,))
+
+    # transfer-outs of a term
+    def transfer_outs(self, term):
+        return self.query(self.queries['transfer_outs'], (term,))
+
+    # enrollments at other institutions overlapping a term or, if within, only those within it
+    def enrolled_elsewhere(self, term, within=False):
+        return self.query(self.queries['enrolled_elsewhere_within' if within else 'enrolled_elsewhere'], (term,))
+
+    # concurrent enrollments of a term
+    def concurrent_enrollments(self, term):
+        return self.query(self.queries['concurrent_enrollments'], (term,))
+
+    # a student's timeline, by Person ID, or None for one not in the cohort tables
+    def timeline(self, person_id):
+        found = self.query(self.queries['timeline'], (person_id,))
+        return json.loads(found[0][0]) if found else None
+
+    # Person IDs of a cohort by an expression over the bitmap index (see cohort_bitmap)
+    def bitmap_cohort(self, expression):
+        with self.connection() as conn:
+            return find_bitmap_cohort(conn, expression)
+
+
+
+################################################################################
+################################# COMMAND LINE #################################
+################################################################################
+
+### read, parse, and add in data from the frozen files in a directory, e.g.
+###     python frozen_files_database_github_version.py some_file_path --db frozen_file_database.db
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load frozen files into the research database.")
+    parser.add_argument('data_path', nargs='?', default=data_path, help="directory containing the csv files to load")
+    parser.add_argument('--db', dest='db_path', default=db_path, help="database file, created if it doesn't exist")
+    parser.add_argument('--chunk-size', type=int, default=chunk_size, help="csv rows written per transaction; 0 loads each file as one transaction")
+    parser.add_argument('--workers', type=int, default=workers, help="processes parsing csv files in parallel")
+    parser.add_argument('--engine', dest='load_engine', choices=load_engines, default=load_engine, help="engine adding parsed records to the database")
+    parser.add_argument('--storage', choices=storages, default=None, help="how demographic entries and enrollment events are stored; by default, as the database already stores them, else %s" % storage)
+    parser.add_argument('--instrument', action='store_true', default=instrument, help="report where the time and rows went")
+    parser.add_argument('--stats-path', default=stats_path, help="write the report of --instrument to this file as JSON")
+    parser.add_argument('--export-path', default=export_path, help="write the columnar export of the fact tables to this directory")
+    parser.add_argument('--bulk', action='store_true', default=bulk, help="load in bulk-load mode, for large initial loads")
+    parser.add_argument('--vacuum', action='store_true', default=vacuum, help="vacuum the database at the end of a bulk load")
+    parser.add_argument('--sharded', action='store_true', default=sharded, help="load the files of each extract in parallel into shard databases, then merge them")
+    parser.add_argument('--shard-path', default=shard_path, help="directory of the shard databases of --sharded")
+    options = parser.parse_args(argv)
+
+    # a --storage other than the one the database holds is reported as a bad option
+    try:
+        loader = FrozenFileLoader(options.db_path, options.data_path, chunk_size=options.chunk_size or None, workers=options.workers,
+                                  load_engine=options.load_engine, storage=options.storage, instrument=options.instrument, stats_path=options.stats_path)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with loader:
+        with loader.bulk_load(vacuum=options.vacuum) if options.bulk else nullcontext():
+            loaded, skipped = loader.load_sharded(options.shard_path) if options.sharded else loader.load_all()
+
+        ### report what was done
+        print("loaded %d frozen files, skipped %d unchanged" % (len(loaded), len(skipped)))
+        for i in loaded:
+            print("  loaded %s (%d records)" % (i, loaded[i]))
+        for i in skipped:
+            print("  skipped %s" % i)
+
+        ### bring the materialized cohort tables up to date for the persons touched by this load
+        with loader.stage('cohort refresh'):
+            print("refreshed cohort tables for %d persons" % loader.refresh_cohort_tables())
+
+        ### write the columnar export of the fact tables
+        if options.export_path is not None:
+            with loader.stage('export'):
+                exported = loader.export_columns(options.export_path)
+            print("exported %s to %s" % (", ".join("%d rows of %s" % (t['rows'], table) for table, t in exported['tables'].items()), options.export_path))
+
+        ### report where the time and rows went
+        if options.instrument:
+            loader.report_stats()
+
+# guarded so that worker processes importing this script to parse files don't load anything themselves
+if __name__ == "__main__":
+    main()